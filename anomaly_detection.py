@@ -1,13 +1,320 @@
 import pandas as pd
+import numpy as np
+import joblib
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.ensemble import IsolationForest
+from traffic_store import read_traffic_data
 
-def detect_anomalies(df):
-    clf = IsolationForest(contamination=0.1, random_state=42)
-    df['anomaly'] = clf.fit_predict(df[["traffic_volume"]])
-    df['anomaly'] = df['anomaly'].map({1: 0, -1: 1})
-    return df
+HOURS_PER_WEEK = 168
+
+def _fit_forest(X, params):
+    return IsolationForest(**params).fit(X)
+
+class AnomalyModel:
+    """
+    IsolationForest anomaly detector that is fitted once and then reused to
+    score any amount of data (labels: 1 = anomaly, 0 = normal).
+
+    With `segment_by` ("cell" for `cell_deg` geocells, or a column name such
+    as "sensor_id"), one forest is trained per segment across a process pool
+    and every row is scored by its own segment's forest. Segments with fewer
+    than `min_segment_rows` rows, or not seen in training, use the global one.
+    """
+
+    def __init__(self, features=("traffic_volume",), contamination=0.1, segment_by=None, cell_deg=0.01,
+                 min_segment_rows=200, n_estimators=100, random_state=42):
+        self.features = list(features)
+        self.params = {"contamination": contamination, "n_estimators": n_estimators, "random_state": random_state}
+        self.segment_by = segment_by
+        self.cell_deg = cell_deg
+        self.min_segment_rows = min_segment_rows
+        self.global_model = None
+        self.segment_models = {}
+
+    def segment_keys(self, df):
+        if self.segment_by == "cell":
+            cell_lat = np.floor(df["lat"].to_numpy() / self.cell_deg).astype(np.int64)
+            cell_lon = np.floor(df["lon"].to_numpy() / self.cell_deg).astype(np.int64)
+            return (cell_lat << 32) + cell_lon
+        return df[self.segment_by].to_numpy()
+
+    def _groups(self, df):
+        keys = self.segment_keys(df)
+        return pd.Series(np.arange(len(keys))).groupby(keys, sort=False).indices
+
+    def fit(self, df, workers=None):
+        X = df[self.features].to_numpy(dtype=np.float32)
+        self.global_model = _fit_forest(X, self.params)
+        self.segment_models = {}
+        if self.segment_by is None:
+            return self
+
+        groups = [(key, idx) for key, idx in self._groups(df).items() if len(idx) >= self.min_segment_rows]
+        print(f"Fitting {len(groups)} segment models...")
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            for key, idx in groups:
+                self.segment_models[key] = _fit_forest(X[idx], self.params)
+            return self
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for key, idx in groups:
+                pending.append((key, pool.submit(_fit_forest, X[idx], self.params)))
+                # Bounded so only a few segments' rows are queued for the workers at once
+                if len(pending) >= 2 * workers:
+                    key_done, future = pending.popleft()
+                    self.segment_models[key_done] = future.result()
+            while pending:
+                key_done, future = pending.popleft()
+                self.segment_models[key_done] = future.result()
+        return self
+
+    def decision_function(self, df):
+        """
+        IsolationForest scores per row; negative means anomalous.
+        """
+        if self.global_model is None:
+            raise Exception("Anomaly model is not fitted yet.")
+        X = df[self.features].to_numpy(dtype=np.float32)
+        if not self.segment_models:
+            return self.global_model.decision_function(X)
+        scores = np.empty(len(X))
+        fallback = []
+        for key, idx in self._groups(df).items():
+            model = self.segment_models.get(key)
+            if model is None:
+                fallback.append(idx)
+            else:
+                scores[idx] = model.decision_function(X[idx])
+        if fallback:
+            idx = np.concatenate(fallback)
+            scores[idx] = self.global_model.decision_function(X[idx])
+        return scores
+
+    def predict(self, df):
+        return (self.decision_function(df) < 0).astype(np.int8)
+
+    def save(self, path):
+        # A plain dict rather than the instance, so a model saved from the CLI
+        # (where this class lives in __main__) loads from any program
+        state = {
+            "features": self.features,
+            "params": self.params,
+            "segment_by": self.segment_by,
+            "cell_deg": self.cell_deg,
+            "min_segment_rows": self.min_segment_rows,
+            "global_model": self.global_model,
+            "segment_models": self.segment_models,
+        }
+        tmp_path = f"{path}.tmp"
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, path)
+        print(f"Anomaly model saved to {path}")
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Anomaly model not found: {path}")
+        state = joblib.load(path)
+        model = cls(features=state["features"], segment_by=state["segment_by"], cell_deg=state["cell_deg"],
+                    min_segment_rows=state["min_segment_rows"], **state["params"])
+        model.global_model = state["global_model"]
+        model.segment_models = state["segment_models"]
+        return model
+
+def detect_anomalies(df, model=None):
+    """
+    Returns a copy of `df` with an 'anomaly' column (1 = anomaly). Without a
+    fitted `model` a global one is fitted on `df` itself.
+    """
+    if model is None:
+        model = AnomalyModel().fit(df)
+    return df.assign(anomaly=model.predict(df))
+
+def score_anomalies_file(input_path, output_path, model_path, chunksize=500_000):
+    """
+    Labels a CSV (or traffic_store directory) of any size chunk by chunk with
+    a saved AnomalyModel, writing rows to `output_path` as they are scored.
+    """
+    model = AnomalyModel.load(model_path)
+    tmp_path = f"{output_path}.tmp"
+    n_rows = n_anomalies = 0
+    with open(tmp_path, "w", newline="") as f:
+        # Read with the file's own dtypes so passthrough columns are written back unchanged
+        for chunk in read_traffic_data(input_path, chunksize=chunksize, compact=False):
+            chunk = detect_anomalies(chunk, model)
+            chunk.to_csv(f, index=False, header=(n_rows == 0))
+            n_rows += len(chunk)
+            n_anomalies += int(chunk["anomaly"].sum())
+            print(f"Scored {n_rows} rows...")
+    os.replace(tmp_path, output_path)
+    print(f"{n_anomalies} anomalies in {n_rows} rows saved to {output_path}")
+    return n_rows
+
+def _npz_path(path):
+    path = os.fspath(path)
+    return path if path.endswith(".npz") else f"{path}.npz"
+
+class StreamingAnomalyDetector:
+    """
+    Flags readings that are unusual for their location and time of week.
+
+    Keeps an exponentially weighted mean and variance per (geocell,
+    hour-of-week) slot in flat float32 arrays that grow as new cells appear,
+    so each update costs O(1) time and memory. A slot only flags once it has
+    seen `warmup` readings; anomalous readings are clipped to the threshold
+    before they update the statistics, so a spike does not mask the next one.
+    """
+
+    def __init__(self, cell_deg=0.01, alpha=0.05, threshold=3.0, warmup=5, initial_cells=256, min_std=1.0):
+        self.cell_deg = cell_deg
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.cells = {}
+        self.mean = np.zeros(initial_cells * HOURS_PER_WEEK, dtype=np.float32)
+        self.var = np.zeros(initial_cells * HOURS_PER_WEEK, dtype=np.float32)
+        self.count = np.zeros(initial_cells * HOURS_PER_WEEK, dtype=np.uint32)
+        self.n_updates = 0
+        self.n_anomalies = 0
+
+    def _slot(self, lat, lon, hour, day_of_week, create=True):
+        key = (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+        cell = self.cells.get(key)
+        if cell is None:
+            if not create:
+                return None
+            cell = self.cells[key] = len(self.cells)
+            if (cell + 1) * HOURS_PER_WEEK > len(self.mean):
+                self._grow()
+        return cell * HOURS_PER_WEEK + int(day_of_week) * 24 + int(hour)
+
+    def _grow(self):
+        # Doubling keeps the amortized cost of new cells constant
+        size = len(self.mean) * 2
+        for name in ("mean", "var", "count"):
+            old = getattr(self, name)
+            new = np.zeros(size, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _z(self, slot, volume):
+        if self.count[slot] < self.warmup:
+            return 0.0
+        std = max(math.sqrt(float(self.var[slot])), self.min_std)
+        return (volume - float(self.mean[slot])) / std
+
+    def score(self, lat, lon, hour, day_of_week, volume):
+        """
+        Returns (z_score, is_anomaly) for a reading without learning from it.
+        """
+        slot = self._slot(lat, lon, hour, day_of_week, create=False)
+        z = 0.0 if slot is None else self._z(slot, volume)
+        return z, abs(z) > self.threshold
+
+    def update(self, lat, lon, hour, day_of_week, volume):
+        """
+        Scores a reading against its slot, then folds it into the slot's
+        statistics. Returns (z_score, is_anomaly).
+        """
+        slot = self._slot(lat, lon, hour, day_of_week)
+        z = self._z(slot, volume)
+        is_anomaly = abs(z) > self.threshold
+        mean = float(self.mean[slot])
+        var = float(self.var[slot])
+        n = int(self.count[slot])
+        if is_anomaly:
+            volume = mean + math.copysign(self.threshold * math.sqrt(var), z)
+        # Plain running averages until the slot has enough history for the EWMA
+        a = max(self.alpha, 1.0 / (n + 1))
+        diff = volume - mean
+        incr = a * diff
+        self.mean[slot] = mean + incr
+        self.var[slot] = (1 - a) * (var + diff * incr)
+        self.count[slot] = min(n + 1, 0xFFFFFFFF)
+        self.n_updates += 1
+        self.n_anomalies += is_anomaly
+        return z, is_anomaly
+
+    def update_many(self, lat, lon, hour, day_of_week, volume):
+        """
+        Feeds readings in arrival order; returns (z_scores, flags) arrays.
+        """
+        n = len(volume)
+        z = np.zeros(n)
+        flags = np.zeros(n, dtype=bool)
+        rows = zip(np.asarray(lat).tolist(), np.asarray(lon).tolist(), np.asarray(hour).tolist(),
+                   np.asarray(day_of_week).tolist(), np.asarray(volume, dtype=np.float64).tolist())
+        for i, row in enumerate(rows):
+            z[i], flags[i] = self.update(*row)
+        return z, flags
+
+    def stats(self):
+        return {
+            "cells": len(self.cells),
+            "updates": self.n_updates,
+            "anomalies": self.n_anomalies,
+            "bytes": self.mean.nbytes + self.var.nbytes + self.count.nbytes,
+        }
+
+    def save(self, path):
+        """
+        Saves the state to `path` and returns the path actually written;
+        np.savez would add ".npz" on its own, so it is added here up front.
+        """
+        path = _npz_path(path)
+        keys = np.array(sorted(self.cells, key=self.cells.get), dtype=np.int64).reshape(-1, 2)
+        n = len(self.cells) * HOURS_PER_WEEK
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, cells=keys, mean=self.mean[:n], var=self.var[:n], count=self.count[:n],
+                     params=np.array([self.cell_deg, self.alpha, self.threshold, self.warmup, self.min_std]))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(_npz_path(path)) as data:
+            cell_deg, alpha, threshold, warmup, min_std = data["params"].tolist()
+            det = cls(cell_deg=cell_deg, alpha=alpha, threshold=threshold, warmup=int(warmup),
+                      initial_cells=max(len(data["cells"]), 1), min_std=min_std)
+            det.cells = {tuple(k): i for i, k in enumerate(data["cells"].tolist())}
+            n = len(data["mean"])
+            det.mean[:n] = data["mean"]
+            det.var[:n] = data["var"]
+            det.count[:n] = data["count"]
+        return det
 
 if __name__ == "__main__":
-    df = pd.read_csv("sample_data.csv")
-    df = detect_anomalies(df)
-    print(df[df['anomaly']==1])
+    import argparse
+    parser = argparse.ArgumentParser(description="Traffic volume anomaly detection.")
+    sub = parser.add_subparsers(dest="command")
+    fit_cmd = sub.add_parser("fit", help="Fit and save an anomaly model")
+    fit_cmd.add_argument("data")
+    fit_cmd.add_argument("model", nargs="?", default="anomaly_model.pkl")
+    fit_cmd.add_argument("--segment-by", default=None, help='"cell" or a column such as sensor_id')
+    fit_cmd.add_argument("--cell-deg", type=float, default=0.01)
+    fit_cmd.add_argument("--min-segment-rows", type=int, default=200)
+    fit_cmd.add_argument("--workers", type=int, default=None)
+    score_cmd = sub.add_parser("score", help="Label a data file with a saved anomaly model")
+    score_cmd.add_argument("input")
+    score_cmd.add_argument("output")
+    score_cmd.add_argument("--model", default="anomaly_model.pkl")
+    score_cmd.add_argument("--chunksize", type=int, default=500_000)
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        model = AnomalyModel(segment_by=args.segment_by, cell_deg=args.cell_deg,
+                             min_segment_rows=args.min_segment_rows)
+        model.fit(read_traffic_data(args.data), workers=args.workers)
+        model.save(args.model)
+    elif args.command == "score":
+        score_anomalies_file(args.input, args.output, args.model, chunksize=args.chunksize)
+    else:
+        df = read_traffic_data("sample_data.csv")
+        df = detect_anomalies(df)
+        print(df[df['anomaly']==1])
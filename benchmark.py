@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from data_generator import write_traffic_data
+from traffic_predictor import TrafficPredictor, BACKENDS
+from geospatial_analysis import find_hotspots
+from incident_integration import fetch_incidents, add_incident_feature
+from anomaly_detection import detect_anomalies
+
+def _rss_mb():
+    """
+    (current, peak) resident set size of this process in MB. Peak comes from
+    VmHWM, which `_reset_peak_rss` can reset; elsewhere it falls back to
+    getrusage's high-water mark for the whole process.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            status = {line.split(":")[0]: int(line.split()[1]) for line in f if line.startswith(("VmRSS", "VmHWM"))}
+        return status["VmRSS"] / 1024, status["VmHWM"] / 1024
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        peak = peak / 1e6 if sys.platform == "darwin" else peak / 1024
+        return peak, peak
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def measure(fn, repeat=1):
+    """
+    Runs `fn` and returns (result, median seconds, peak RSS MB, extra MB).
+    Peak RSS covers everything the process holds, native sklearn/Cython
+    buffers included; extra MB is how far it rose above the RSS before the
+    stage. Nothing is traced, so timings are not inflated; with `repeat` > 1
+    the timing comes from `repeat` further runs.
+    """
+    _reset_peak_rss()
+    before, _ = _rss_mb()
+    start = time.perf_counter()
+    result = fn()
+    times = [time.perf_counter() - start]
+    _, peak = _rss_mb()
+    if repeat > 1:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return result, float(np.median(times)), peak, max(peak - before, 0.0)
+
+def run_size(n_rows, workdir, backend, max_train_rows, max_cluster_rows, repeat):
+    results = []
+    def record(stage, seconds, peak_rss_mb, extra_mb, **extra):
+        results.append({"size": n_rows, "stage": stage, "seconds": seconds, "peak_rss_mb": peak_rss_mb,
+                        "extra_rss_mb": extra_mb, **extra})
+        print(f"  {stage:<24} {seconds * 1000:>12.3f} ms  peak {peak_rss_mb:>9.1f} MB  (+{extra_mb:.1f} MB)")
+
+    data_path = os.path.join(workdir, f"traffic_{n_rows}.csv")
+    write_traffic_data(data_path, n_rows, seed=42)
+    tp = TrafficPredictor(model_path=os.path.join(workdir, f"model_{n_rows}.pkl"), backend=backend)
+
+    (X, y), seconds, *peak = measure(lambda: tp.load_data(data_path))
+    record("load", seconds, *peak)
+
+    n_train = min(len(X), max_train_rows)
+    _, seconds, *peak = measure(lambda: tp.train(X.iloc[:n_train], y.iloc[:n_train]))
+    record("train", seconds, *peak, rows=n_train)
+
+    row = X.iloc[:1]
+    _, seconds, *peak = measure(lambda: tp.predict(row), repeat=max(repeat, 20))
+    record("predict_single", seconds, *peak)
+
+    _, seconds, *peak = measure(lambda: tp.predict(X), repeat=repeat)
+    record("predict_batch", seconds, *peak, us_per_row=seconds / len(X) * 1e6)
+
+    if tp.compile() is not None:
+        _, seconds, *peak = measure(lambda: tp.predict(row), repeat=max(repeat, 20))
+        record("predict_single_compiled", seconds, *peak)
+
+    df = X.assign(traffic_volume=y)
+    cluster_df = df.iloc[:max_cluster_rows]
+    _, seconds, *peak = measure(lambda: find_hotspots(cluster_df.copy()), repeat=repeat)
+    record("find_hotspots", seconds, *peak, rows=len(cluster_df))
+
+    _, seconds, *peak = measure(lambda: find_hotspots(df, method="grid"), repeat=repeat)
+    record("find_hotspots_grid", seconds, *peak, rows=len(df))
+
+    incidents = fetch_incidents()
+    _, seconds, *peak = measure(lambda: add_incident_feature(df, incidents), repeat=repeat)
+    record("add_incident_feature", seconds, *peak)
+
+    _, seconds, *peak = measure(lambda: detect_anomalies(df), repeat=repeat)
+    record("detect_anomalies", seconds, *peak)
+
+    os.remove(data_path)
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Prints per-stage ratios against a baseline and returns the regressions,
+    i.e. stages more than `tolerance` (0.2 = 20%) slower than before.
+    """
+    base = {(r["size"], r["stage"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'size':>10} {'stage':<24} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for r in results:
+        old = base.get((r["size"], r["stage"]))
+        if old is None or old["seconds"] <= 0:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        flag = " REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{r['size']:>10} {r['stage']:<24} {old['seconds'] * 1000:>12.3f} {r['seconds'] * 1000:>12.3f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append({**r, "baseline_seconds": old["seconds"], "ratio": ratio})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the traffic prediction pipeline on synthetic data.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Comma-separated row counts (e.g. 1000,100000,10000000)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="forest")
+    parser.add_argument("--max-train-rows", type=int, default=1_000_000,
+                        help="Train on at most this many rows per size")
+    parser.add_argument("--max-cluster-rows", type=int, default=20_000,
+                        help="Rows for the legacy degree-based DBSCAN stage, whose memory grows "
+                             "quadratically (~1.5 GB at 100k rows); the grid stage always uses all rows")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="Baseline results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in sizes:
+            print(f"\n=== {n_rows} rows ===")
+            results += run_size(n_rows, workdir, args.backend, args.max_train_rows,
+                                args.max_cluster_rows, args.repeat)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": args.backend,
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
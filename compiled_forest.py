@@ -0,0 +1,345 @@
+import numpy as np
+import copy
+import json
+import os
+import shutil
+
+ARRAYS = ("feature", "threshold", "children", "value", "roots", "missing_left")
+
+def _depth_cap(depth, is_leaf, limit, max_depth=None, max_leaf_nodes=None):
+    """
+    Level at which one tree (its node depths and leaf flags) is cut: at most
+    `max_depth`, and the deepest level that keeps at most `max_leaf_nodes`
+    leaves. `limit` is the depth that means "not cut".
+    """
+    cap = limit if max_depth is None else min(max_depth, limit)
+    if max_leaf_nodes is not None:
+        leaf_counts = np.bincount(depth[is_leaf], minlength=limit + 1)
+        node_counts = np.bincount(depth, minlength=limit + 1)
+        # Leaves if the tree is cut at level k: leaves above k plus every node at k
+        leaves_at = np.concatenate([[0], np.cumsum(leaf_counts)[:-1]]) + node_counts
+        ok = np.nonzero(leaves_at <= max_leaf_nodes)[0]
+        cap = min(cap, ok.max() if ok.size else 0)
+    return cap
+
+def _tree_depths(left, right):
+    depth = np.full(len(left), -1, dtype=np.int64)
+    frontier = np.array([0])
+    level = 0
+    while frontier.size:
+        depth[frontier] = level
+        kids = np.concatenate([left[frontier], right[frontier]])
+        frontier = kids[kids >= 0]
+        level += 1
+    return depth
+
+def prune_forest(model, max_depth=None, max_leaf_nodes=None):
+    """
+    Returns a copy of a fitted sklearn tree ensemble with every tree cut the
+    same way as `CompiledForest.prune`, so the saved model matches a pruned
+    compiled forest. The original model is left untouched.
+    """
+    estimators = getattr(model, "estimators_", None)
+    if not estimators or not hasattr(estimators[0], "tree_"):
+        raise ValueError(f"Cannot prune {type(model).__name__}: expected a fitted tree ensemble")
+    limit = max(est.tree_.max_depth for est in estimators)
+    pruned = copy.copy(model)
+    pruned.estimators_ = []
+    for est in estimators:
+        state = est.tree_.__getstate__()
+        nodes = state["nodes"]
+        left, right = nodes["left_child"], nodes["right_child"]
+        is_leaf = left == -1
+        depth = _tree_depths(left, right)
+        cap = _depth_cap(depth, is_leaf, limit, max_depth, max_leaf_nodes)
+        keep = depth <= cap
+        new_leaf = (is_leaf | (depth == cap))[keep]
+        new_id = np.cumsum(keep) - 1
+        kept = nodes[keep].copy()
+        kept["left_child"] = np.where(new_leaf, -1, new_id[left[keep]])
+        kept["right_child"] = np.where(new_leaf, -1, new_id[right[keep]])
+        # sklearn's markers for leaves
+        kept["feature"] = np.where(new_leaf, -2, kept["feature"])
+        kept["threshold"] = np.where(new_leaf, -2.0, kept["threshold"])
+        if "missing_go_to_left" in kept.dtype.names:
+            kept["missing_go_to_left"] = np.where(new_leaf, 0, kept["missing_go_to_left"])
+
+        tree_cls, tree_args = est.tree_.__reduce__()[:2]
+        tree = tree_cls(*tree_args)
+        tree.__setstate__({"max_depth": int(min(cap, state["max_depth"])), "node_count": int(keep.sum()),
+                           "nodes": kept, "values": np.ascontiguousarray(state["values"][keep])})
+        new_est = copy.copy(est)
+        new_est.tree_ = tree
+        pruned.estimators_.append(new_est)
+    return pruned
+
+class CompiledForest:
+    """
+    A tree ensemble flattened into plain NumPy arrays.
+
+    All trees share one node table and leaves point to themselves, so all
+    trees (and all rows of a batch) advance together one level per vectorized
+    step until every path has reached a leaf. Single rows take a plain Python
+    walk over memoryviews of the same arrays, which avoids per-level NumPy
+    call overhead. Predictions match sklearn's RandomForestRegressor and
+    ExtraTreesRegressor exactly: inputs are compared as float32 against float64 thresholds and
+    tree outputs are summed in estimator order before averaging.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, missing_left=None, n_features=None,
+                 exact=True):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children  # (n_nodes, 2): [left, right]
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.missing_left = missing_left
+        self.n_features = n_features
+        # False once pruning or narrowing means it no longer matches the sklearn model
+        self.exact = exact
+        self._views = None
+
+    @classmethod
+    def from_sklearn(cls, model):
+        estimators = getattr(model, "estimators_", None)
+        if not estimators or not hasattr(estimators[0], "tree_"):
+            raise ValueError(f"Cannot compile {type(model).__name__}: expected a fitted tree ensemble")
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output ensembles can be compiled")
+
+        features, thresholds, children, values, missing, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            ids = np.arange(offset, offset + n)
+            left = np.where(is_leaf, ids, tree.children_left + offset)
+            right = np.where(is_leaf, ids, tree.children_right + offset)
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            # +inf keeps a leaf pointing at itself whatever the input value is
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children.append(np.stack([left, right], axis=1))
+            values.append(tree.value[:, 0, 0])
+            mgl = getattr(tree, "missing_go_to_left", None)
+            missing.append(np.zeros(n, dtype=bool) if mgl is None else np.asarray(mgl, dtype=bool) & ~is_leaf)
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            missing_left=np.concatenate(missing),
+            n_features=getattr(model, "n_features_in_", None),
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS if getattr(self, name) is not None)
+
+    def node_depths(self):
+        depth = np.full(self.n_nodes, -1, dtype=np.int64)
+        frontier = np.asarray(self.roots, dtype=np.intp)
+        depth[frontier] = 0
+        level = 0
+        while frontier.size:
+            kids = self.children[frontier].ravel().astype(np.intp)
+            kids = kids[depth[kids] < 0]  # leaves point to themselves and are already set
+            level += 1
+            depth[kids] = level
+            frontier = kids
+        return depth
+
+    def prune(self, max_depth=None, max_leaf_nodes=None):
+        """
+        Returns a forest whose trees are cut at `max_depth` and, per tree, at
+        the deepest level that keeps at most `max_leaf_nodes` leaves. Cut
+        nodes become leaves predicting the mean stored at that node.
+        """
+        depth = self.node_depths()
+        roots = np.asarray(self.roots, dtype=np.intp)
+        tree_of = np.searchsorted(roots, np.arange(self.n_nodes), side="right") - 1
+        is_leaf = self.children[:, 0] == np.arange(self.n_nodes)
+
+        caps = np.full(self.n_trees, self.max_depth if max_depth is None else min(max_depth, self.max_depth))
+        if max_leaf_nodes is not None:
+            for t in range(self.n_trees):
+                in_tree = tree_of == t
+                caps[t] = _depth_cap(depth[in_tree], is_leaf[in_tree], self.max_depth, max_depth, max_leaf_nodes)
+
+        cap = caps[tree_of]
+        keep = depth <= cap
+        new_leaf = is_leaf | (depth == cap)
+        new_id = np.cumsum(keep) - 1
+        ids = new_id[keep]
+        kept_leaf = new_leaf[keep]
+        children = np.where(kept_leaf[:, None], ids[:, None], new_id[self.children[keep].astype(np.intp)])
+        return CompiledForest(
+            feature=np.where(kept_leaf, 0, self.feature[keep]).astype(self.feature.dtype),
+            threshold=np.where(kept_leaf, np.inf, self.threshold[keep]).astype(self.threshold.dtype),
+            children=children.astype(self.children.dtype),
+            value=np.asarray(self.value[keep]),
+            roots=new_id[roots].astype(self.roots.dtype),
+            max_depth=int(caps.max()),
+            missing_left=None if self.missing_left is None else self.missing_left[keep] & ~kept_leaf,
+            n_features=self.n_features,
+            exact=self.exact and not bool((caps < self.max_depth).any()),
+        )
+
+    def compact(self):
+        """
+        Returns the same forest in narrow types: float32 thresholds and leaf
+        values, int8/int16 feature ids and int32 node ids. Thresholds are
+        rounded down to the nearest float32, which keeps every split decision
+        for float32 inputs unchanged; only leaf values lose precision.
+        """
+        threshold = self.threshold.astype(np.float32)
+        above = threshold.astype(np.float64) > self.threshold
+        threshold[above] = np.nextafter(threshold[above], np.float32(-np.inf))
+        feature_dtype = np.int8 if (self.n_features or 0) <= 127 else np.int16
+        return CompiledForest(
+            feature=self.feature.astype(feature_dtype),
+            threshold=threshold,
+            children=self.children.astype(np.int32),
+            value=self.value.astype(np.float32),
+            roots=np.asarray(self.roots).astype(np.int32),
+            max_depth=self.max_depth,
+            missing_left=self.missing_left,
+            n_features=self.n_features,
+            exact=False,
+        )
+
+    def _walk(self, X):
+        """
+        Returns the leaf reached in every tree, shape (n_trees, n_rows).
+        Only paths that have not reached a leaf yet are advanced at each level.
+        """
+        n_rows, n_cols = X.shape
+        xf = X.ravel()
+        nodes = np.repeat(self.roots, n_rows)
+        row_base = np.tile(np.arange(n_rows) * n_cols, self.n_trees)
+        children = self.children.ravel()
+        check_nan = self.missing_left is not None and np.isnan(xf).any()
+        active = np.arange(nodes.size)
+        for _ in range(self.max_depth):
+            n = nodes[active]
+            x = xf[row_base[active] + self.feature[n]]
+            if check_nan:
+                go_right = ~(x <= self.threshold[n]) & ~(np.isnan(x) & self.missing_left[n])
+            else:
+                go_right = x > self.threshold[n]
+            nxt = children[2 * n + go_right]
+            nodes[active] = nxt
+            active = active[nxt != n]
+            if not active.size:
+                break
+        return nodes.reshape(self.n_trees, n_rows)
+
+    def _average(self, leaf_values):
+        # Sum tree by tree, in estimator order, as sklearn does
+        out = leaf_values[0].astype(np.float64)
+        for tree_values in leaf_values[1:]:
+            out += tree_values
+        out /= self.n_trees
+        return out
+
+    def predict_one(self, x):
+        """
+        Predicts a single row given as a 1-D sequence of feature values.
+        """
+        # float32 values widened back to Python floats compare exactly as sklearn's float32 inputs do
+        x = np.asarray(x, dtype=np.float32).ravel()
+        if np.isnan(x).any():
+            return float(self._average(self.value[self._walk(x.reshape(1, -1))])[0])
+        x = x.tolist()
+        if self._views is None:
+            self._views = tuple(memoryview(np.ascontiguousarray(a)) for a in
+                                (self.feature, self.threshold, self.children.ravel(), self.value))
+        feature, threshold, children, value = self._views
+        total = 0.0
+        for node in self.roots.tolist():
+            while True:
+                nxt = children[2 * node] if x[feature[node]] <= threshold[node] else children[2 * node + 1]
+                if nxt == node:
+                    break
+                node = nxt
+            total += value[node]
+        return total / self.n_trees
+
+    def predict(self, X, batch_size=4096):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if self.n_features is not None and X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the model expects {self.n_features}")
+        if X.shape[0] == 1:
+            return np.array([self.predict_one(X[0])])
+        out = np.empty(X.shape[0], dtype=np.float64)
+        # Batches bound the (n_trees, batch_size) node matrix
+        for start in range(0, X.shape[0], batch_size):
+            batch = X[start:start + batch_size]
+            out[start:start + len(batch)] = self._average(self.value[self._walk(batch)])
+        return out
+
+    def save(self, path, source=None):
+        """
+        Writes one uncompressed .npy file per array into directory `path`, so
+        `load(path)` can memory-map them. `source` is stored in meta.json to
+        tie the arrays to the model artifact they were exported from.
+        """
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in ARRAYS:
+            array = getattr(self, name)
+            if array is not None:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_features": self.n_features, "exact": self.exact,
+                       "source": source}, f)
+        # Swap directories so processes that still map the old files keep valid pages
+        old_path = f"{path}.old"
+        if os.path.exists(path):
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @staticmethod
+    def read_meta(path):
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Loads arrays saved by `save`. With the default read-only mmap, the
+        pages are shared by every process that loads the same directory.
+        """
+        meta = cls.read_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"Compiled forest not found: {path}")
+        arrays = {}
+        for name in ARRAYS:
+            file = os.path.join(path, f"{name}.npy")
+            arrays[name] = np.load(file, mmap_mode=mmap_mode) if os.path.exists(file) else None
+        return cls(max_depth=meta["max_depth"], n_features=meta["n_features"], exact=meta.get("exact", True),
+                   **arrays)
@@ -1,72 +1,65 @@
 import pandas as pd
 import numpy as np
-import random
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+def compute_traffic_volume(hours, days, weather, events, noise):
+    """
+    Vectorized traffic volume rules.
+    All arguments are equal-length arrays; returns an int64 array of volumes.
+    """
+    base_vol = np.full(len(hours), 500.0)
+
+    # Time of day effects (Rush hours)
+    base_vol += np.select(
+        [(hours >= 7) & (hours <= 9),    # Morning rush
+         (hours >= 16) & (hours <= 19),  # Evening rush
+         (hours >= 10) & (hours <= 15),  # Mid-day
+         (hours >= 0) & (hours <= 5)],   # Late night
+        [1500, 1800, 800, -300],
+        default=0,
+    )
+
+    # Weekend reduction (Sat/Sun)
+    base_vol *= np.where(days >= 5, 0.6, 1.0)
+
+    # Weather impact: Rain -> fewer trips, Snow -> much fewer
+    base_vol *= np.select([weather == 3, weather == 4], [0.9, 0.7], default=1.0)
+
+    # Event impact
+    base_vol += np.where(events == 1, 1000, 0)
+
+    # Random noise, truncated like int() and floored at zero
+    return np.maximum(0, np.trunc(base_vol + noise)).astype(np.int64)
+
+def _generate_chunk(rng, n_samples):
+    hours = rng.integers(0, 24, n_samples)
+    days = rng.integers(0, 7, n_samples)
 
-def generate_traffic_data(n_samples=10000):
-    print(f"Generating {n_samples} samples of synthetic traffic data...")
-    
-    # Base data
-    hours = np.random.randint(0, 24, n_samples)
-    days = np.random.randint(0, 7, n_samples)
-    
     # Weather: 1=Clear, 2=Cloudy, 3=Rain, 4=Snow
     # Weighted probabilities: mostly clear/cloudy
-    weather = np.random.choice([1, 2, 3, 4], n_samples, p=[0.5, 0.3, 0.15, 0.05])
-    
+    weather = rng.choice([1, 2, 3, 4], n_samples, p=[0.5, 0.3, 0.15, 0.05])
+
     # Location (NYC area approx)
     lat_base = 40.7128
     lon_base = -74.0060
-    lats = lat_base + np.random.normal(0, 0.05, n_samples)
-    lons = lon_base + np.random.normal(0, 0.05, n_samples)
-    
+    lats = lat_base + rng.normal(0, 0.05, n_samples)
+    lons = lon_base + rng.normal(0, 0.05, n_samples)
+
     # Events: 0=None, 1=Event
-    events = np.random.choice([0, 1], n_samples, p=[0.9, 0.1])
-    
+    events = rng.choice([0, 1], n_samples, p=[0.9, 0.1])
+
     # Environmental factors
-    wind = np.random.randint(0, 40, n_samples)
-    precip = np.random.uniform(0, 10, n_samples)
-    visibility = np.random.randint(5, 20, n_samples)
-    pollution = np.random.randint(10, 100, n_samples)
-    
-    # Calculate Traffic Volume based on rules
-    traffic_volume = []
-    
-    for i in range(n_samples):
-        base_vol = 500
-        
-        # Time of day effects (Rush hours)
-        h = hours[i]
-        if 7 <= h <= 9: # Morning rush
-            base_vol += 1500
-        elif 16 <= h <= 19: # Evening rush
-            base_vol += 1800
-        elif 10 <= h <= 15: # Mid-day
-            base_vol += 800
-        elif 0 <= h <= 5: # Late night
-            base_vol -= 300
-            
-        # Weekend reduction
-        if days[i] >= 5: # Sat/Sun
-            base_vol *= 0.6
-            
-        # Weather impact
-        w = weather[i]
-        if w == 3: # Rain
-            base_vol *= 0.9 # Slower/less traffic? Or more congestion? Let's say less volume but slower. 
-                            # Actually volume might drop if people stay home.
-        elif w == 4: # Snow
-            base_vol *= 0.7
-            
-        # Event impact
-        if events[i] == 1:
-            base_vol += 1000
-            
-        # Random noise
-        noise = np.random.normal(0, 200)
-        final_vol = max(0, int(base_vol + noise))
-        traffic_volume.append(final_vol)
-        
-    df = pd.DataFrame({
+    wind = rng.integers(0, 40, n_samples)
+    precip = rng.uniform(0, 10, n_samples)
+    visibility = rng.integers(5, 20, n_samples)
+    pollution = rng.integers(10, 100, n_samples)
+
+    noise = rng.normal(0, 200, n_samples)
+    traffic_volume = compute_traffic_volume(hours, days, weather, events, noise)
+
+    return pd.DataFrame({
         "hour": hours,
         "day_of_week": days,
         "weather": weather,
@@ -79,10 +72,194 @@ def generate_traffic_data(n_samples=10000):
         "pollution": pollution,
         "traffic_volume": traffic_volume
     })
-    
-    return df
+
+def generate_traffic_chunks(n_samples, chunk_size=1_000_000, seed=None):
+    """
+    Yields DataFrames of at most `chunk_size` rows until `n_samples` rows
+    have been produced. The same seed always yields the same rows.
+    """
+    rng = np.random.default_rng(seed)
+    remaining = n_samples
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        yield _generate_chunk(rng, n)
+        remaining -= n
+
+def generate_traffic_data(n_samples=10000, seed=None):
+    print(f"Generating {n_samples} samples of synthetic traffic data...")
+    return _generate_chunk(np.random.default_rng(seed), n_samples)
+
+def write_traffic_data(path, n_samples, chunk_size=1_000_000, seed=None):
+    """
+    Streams `n_samples` synthetic rows to a CSV file chunk by chunk,
+    so memory use is bounded by `chunk_size` regardless of the total size.
+    """
+    print(f"Writing {n_samples} samples of synthetic traffic data to {path}...")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        for i, chunk in enumerate(generate_traffic_chunks(n_samples, chunk_size, seed)):
+            chunk.to_csv(f, index=False, header=(i == 0), float_format="%.6f")
+    os.replace(tmp_path, path)
+    return path
+
+# --- Sensor network time series ---
+
+WEATHER_STATES = np.array([1, 2, 3, 4])
+WEATHER_PROBS = [0.5, 0.3, 0.15, 0.05]
+
+def _sensor_seed(seed, stream, index=0):
+    # Child seeds depend only on (seed, stream, index), never on worker count or scheduling order
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return np.random.SeedSequence(root.entropy, spawn_key=(stream, index))
+
+def sensor_layout(n_sensors, seed):
+    """
+    Fixed sensor positions around NYC and a per-sensor baseline multiplier.
+    """
+    rng = np.random.default_rng(_sensor_seed(seed, 0))
+    return pd.DataFrame({
+        "sensor_id": np.arange(n_sensors),
+        "lat": 40.7128 + rng.normal(0, 0.05, n_sensors),
+        "lon": -74.0060 + rng.normal(0, 0.05, n_sensors),
+        "baseline": rng.lognormal(0, 0.35, n_sensors),
+        "pollution_base": rng.uniform(10, 80, n_sensors),
+    })
+
+def weather_fronts(n_steps, freq_minutes, seed, mean_duration_hours=6):
+    """
+    Region-wide weather series. Each step keeps the current state unless a
+    new front arrives, so conditions persist for ~mean_duration_hours.
+    """
+    rng = np.random.default_rng(_sensor_seed(seed, 1))
+    p_change = min(1.0, freq_minutes / (60.0 * mean_duration_hours))
+    change = rng.random(n_steps) < p_change
+    change[0] = True
+    draws = rng.choice(WEATHER_STATES, n_steps, p=WEATHER_PROBS)
+    # Forward-fill the state drawn at the last front
+    last_change = np.maximum.accumulate(np.where(change, np.arange(n_steps), 0))
+    weather = draws[last_change]
+
+    wet = weather >= 3
+    return {
+        "weather": weather,
+        "wind": np.clip(rng.normal(10 + 8 * wet, 5, n_steps), 0, 39).astype(np.int64),
+        "precip": np.where(wet, rng.uniform(0.5, 10, n_steps), 0.0),
+        "visibility": np.where(wet, rng.integers(5, 11, n_steps), rng.integers(10, 20, n_steps)),
+    }
+
+def _generate_sensor_shard(args):
+    shard_index, layout, lon_range, fronts, times, step_lo, freq_minutes, front_lag_hours, seed = args
+    rng = np.random.default_rng(_sensor_seed(seed, 2, shard_index))
+    n_sensors, n_steps = len(layout), len(times)
+    n = n_sensors * n_steps
+
+    # Fronts sweep west to east: eastern sensors see the regional weather later
+    lon = layout["lon"].to_numpy()
+    lon_min, span = lon_range
+    lag = np.rint((lon - lon_min) / span * front_lag_hours * 60 / freq_minutes).astype(np.int64)
+    steps = np.arange(step_lo, step_lo + n_steps)
+    step_idx = np.clip(steps[None, :] - lag[:, None], 0, None).ravel()
+
+    hours = np.tile(times.hour.to_numpy(), n_sensors)
+    days = np.tile(times.dayofweek.to_numpy(), n_sensors)
+    weather = fronts["weather"][step_idx]
+    events = (rng.random(n) < 0.02).astype(np.int64)
+    noise = rng.normal(0, 200, n)
+
+    baseline = np.repeat(layout["baseline"].to_numpy(), n_steps)
+    volume = compute_traffic_volume(hours, days, weather, events, noise)
+    volume = (volume * baseline).astype(np.int64)
+
+    return pd.DataFrame({
+        "sensor_id": np.repeat(layout["sensor_id"].to_numpy(), n_steps),
+        "timestamp": np.tile(times.to_numpy(), n_sensors),
+        "hour": hours,
+        "day_of_week": days,
+        "weather": weather,
+        "lat": np.repeat(layout["lat"].to_numpy(), n_steps),
+        "lon": np.repeat(layout["lon"].to_numpy(), n_steps),
+        "event": events,
+        "wind": fronts["wind"][step_idx],
+        "precip": fronts["precip"][step_idx],
+        "visibility": fronts["visibility"][step_idx],
+        "pollution": np.clip(np.repeat(layout["pollution_base"].to_numpy(), n_steps) + rng.normal(0, 8, n), 0, 100).astype(np.int64),
+        "traffic_volume": volume,
+    })
+
+def generate_sensor_shards(n_sensors, n_steps, freq_minutes=60, start="2024-01-01", seed=None,
+                           rows_per_shard=1_000_000, workers=None, front_lag_hours=3):
+    """
+    Simulates `n_sensors` fixed sensors over `n_steps` timesteps of
+    `freq_minutes` each, yielding DataFrames of at most `rows_per_shard` rows
+    in sensor order. A shard is a block of whole sensors, or, when one
+    sensor's series is longer than that, a block of one sensor's timesteps,
+    so memory per shard stays bounded whatever the series length.
+    Shards run in a process pool; each has its own deterministic seed, so the
+    output is identical for any number of workers.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    layout = sensor_layout(n_sensors, seed)
+    fronts = weather_fronts(n_steps, freq_minutes, seed)
+    times = pd.date_range(start, periods=n_steps, freq=f"{freq_minutes}min")
+    # Lags are relative to the whole network, not to each shard
+    lon = layout["lon"].to_numpy()
+    lon_range = (lon.min(), max(np.ptp(lon), 1e-9) if n_sensors > 1 else 1.0)
+    sensors_per_shard = max(1, rows_per_shard // max(n_steps, 1))
+    steps_per_shard = min(n_steps, rows_per_shard) or 1
+
+    def shard_args():
+        i = 0
+        for lo in range(0, n_sensors, sensors_per_shard):
+            block = layout.iloc[lo:lo + sensors_per_shard]
+            for t in range(0, n_steps, steps_per_shard):
+                yield (i, block, lon_range, fronts, times[t:t + steps_per_shard], t, freq_minutes,
+                       front_lag_hours, seed)
+                i += 1
+
+    if workers == 1:
+        for args in shard_args():
+            yield _generate_sensor_shard(args)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded number of shards in flight so memory stays flat
+        pending = deque()
+        max_pending = 2 * workers
+        for args in shard_args():
+            pending.append(pool.submit(_generate_sensor_shard, args))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def generate_sensor_network(n_sensors, n_steps, **kwargs):
+    print(f"Generating {n_sensors} sensors x {n_steps} steps of synthetic traffic data...")
+    return pd.concat(generate_sensor_shards(n_sensors, n_steps, **kwargs), ignore_index=True)
+
+def write_sensor_network(path, n_sensors, n_steps, **kwargs):
+    """
+    Streams a sensor network simulation to CSV shard by shard.
+    """
+    print(f"Writing {n_sensors} sensors x {n_steps} steps of synthetic traffic data to {path}...")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        for i, shard in enumerate(generate_sensor_shards(n_sensors, n_steps, **kwargs)):
+            shard.to_csv(f, index=False, header=(i == 0), float_format="%.6f")
+    os.replace(tmp_path, path)
+    return path
 
 if __name__ == "__main__":
-    df = generate_traffic_data(15000)
-    df.to_csv("traffic_data_large.csv", index=False)
-    print("Saved to traffic_data_large.csv")
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "sensors":
+        # python data_generator.py sensors <n_sensors> <n_steps> [freq_minutes]
+        n_sensors = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+        n_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 24 * 7
+        freq_minutes = int(sys.argv[4]) if len(sys.argv) > 4 else 60
+        write_sensor_network("traffic_sensors.csv", n_sensors, n_steps, freq_minutes=freq_minutes)
+        print("Saved to traffic_sensors.csv")
+    else:
+        n_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 15000
+        write_traffic_data("traffic_data_large.csv", n_samples)
+        print("Saved to traffic_data_large.csv")
@@ -18,36 +18,93 @@ from streamlit_geolocation import streamlit_geolocation
 # Local imports
 from traffic_predictor import TrafficPredictor
 from incident_integration import fetch_incidents, add_incident_feature
-from geospatial_analysis import find_hotspots, visualize_hotspots
+from geospatial_analysis import HotspotTracker, visualize_hotspots
 from weather_integration import fetch_current_weather
 from tomtom_integration import fetch_real_time_incidents, fetch_real_time_traffic
+from traffic_store import read_traffic_data, is_store
+from lookup_table import LookupTable
+from anomaly_detection import StreamingAnomalyDetector
 
 st.set_page_config(page_title="Traffic Prediction System", layout="wide")
 
 # --- Helper Functions ---
 @st.cache_resource
 def load_model_and_predictor():
+    # The constructor already loads traffic_model.pkl (lazily, once per process)
     tp = TrafficPredictor()
-    # Ensure model is trained/loaded
+    if tp.is_trained:
+        try:
+            # Forecasts and Live Monitor ticks score one row at a time
+            tp.compile()
+        except Exception as e:
+            # A lazily loaded artifact can turn out unreadable here; it then counts as no model
+            print(f"Could not load existing model: {e}")
     if not tp.is_trained:
+        # No usable saved model yet, train on sample data
         try:
-            tp.load("traffic_model.pkl")
-        except:
-            # If load fails, try to train on sample data
-            try:
-                X, y = tp.load_data("sample_data.csv")
-                tp.train(X, y)
-            except Exception as e:
-                st.error(f"Failed to initialize model: {e}")
+            X, y = tp.load_data("sample_data.csv")
+            tp.train(X, y)
+            tp.compile()
+        except Exception as e:
+            st.error(f"Failed to initialize model: {e}")
+    # Users mostly ask for the same hour/day/weather near the same spot
+    tp.enable_cache(max_size=50000, ttl=600)
     return tp
 
-@st.cache_data
-def load_data():
+# Prefer the partitioned store when one has been ingested (python traffic_store.py <csv> traffic_store)
+DATA_SOURCE = "traffic_store" if is_store("traffic_store") else "sample_data.csv"
+
+@st.cache_resource
+def load_lookup_table(model_id):
+    # Optional distilled model (python traffic_predictor.py export-table <data>)
+    try:
+        lut = LookupTable.load("traffic_lut.npz")
+    except Exception:
+        return None
+    # A table exported from an earlier model would keep serving its stale predictions
+    if model_id is None or lut.source != list(model_id):
+        print("Ignoring traffic_lut.npz: it was not exported from the current model")
+        return None
+    return lut
+
+# Re-read now and then so rows ingested while the app runs reach the Live Map
+@st.cache_data(ttl=60)
+def load_data(near=None, radius_km=5.0):
     try:
-        return pd.read_csv("sample_data.csv")
+        return read_traffic_data(DATA_SOURCE, near=near, radius_km=radius_km)
     except:
         return pd.DataFrame()
 
+def update_hotspots(df, location):
+    """
+    Feeds the rows of `df` the session's HotspotTracker has not seen yet and
+    returns `df` with their current 'hotspot' labels. Hotspots are kept up to
+    date incrementally instead of being reclustered on every rerun; the
+    tracker starts over when the location changes.
+    """
+    state = st.session_state
+    if state.get("hotspot_location") != location or len(df) < state.get("hotspot_rows", 0):
+        # Rows without timestamps never age out of the window
+        window_s = 900.0 if "timestamp" in df.columns else float("inf")
+        state.hotspot_tracker = HotspotTracker(window_s=window_s, ref_lat=location[0])
+        state.hotspot_location = location
+        state.hotspot_rows = 0
+    tracker = state.hotspot_tracker
+    new = df.iloc[state.hotspot_rows:]
+    if "timestamp" in df.columns:
+        new = new.sort_values("timestamp")
+        times = pd.to_datetime(new["timestamp"]).to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+        # The window follows the data's clock, not the wall clock
+        if len(times):
+            state.hotspot_now = times.max()
+        events = tracker.update(new["lat"].to_numpy(), new["lon"].to_numpy(), times, now=state.hotspot_now)
+    else:
+        events = tracker.update(new["lat"].to_numpy(), new["lon"].to_numpy())
+    state.hotspot_rows = len(df)
+    for event in events:
+        print(f"Hotspot {event['id']} {event['type']}: {event['cells']} cells, {event['points']} points")
+    return df.assign(hotspot=tracker.labels(df["lat"].to_numpy(), df["lon"].to_numpy()))
+
 # --- Main App ---
 def main():
     st.sidebar.title("Navigation")
@@ -317,21 +374,11 @@ def main():
 
         if st.button("Predict Traffic Volume", type="primary", use_container_width=True):
             # 1. Model Prediction
-            input_data = pd.DataFrame({
-                "hour": [hour],
-                "day_of_week": [day],
-                "weather": [weather],
-                "lat": [lat],
-                "lon": [lon],
-                "event": [1 if event else 0],
-                "wind": [wind],
-                "precip": [precip],
-                "visibility": [visibility],
-                "pollution": [pollution]
-            })
-            
             try:
-                prediction = tp.predict(input_data)[0]
+                conditions = {"weather": weather, "wind": wind, "precip": precip,
+                              "visibility": visibility, "pollution": pollution}
+                prediction = tp.predict_request(lat, lon, weather=conditions, hour=hour, day_of_week=day,
+                                                event=1 if event else 0)
                 
                 # 2. Real-time Correction (Accuracy Boost)
                 real_traffic = None
@@ -408,9 +455,11 @@ def main():
             components.html(map_html, height=600)
         else:
             # Default view
-            if not data.empty:
-                df_hotspots = find_hotspots(data.copy())
-                m = visualize_hotspots(df_hotspots)
+            local_data = load_data(near=(lat, lon)) if DATA_SOURCE != "sample_data.csv" else data
+            if not local_data.empty:
+                df_hotspots = update_hotspots(local_data, (round(lat, 4), round(lon, 4)))
+                st.caption(f"{len(st.session_state.hotspot_tracker.clusters)} active hotspots")
+                m = visualize_hotspots(df_hotspots, mode="aggregate")
                 map_html = m._repr_html_()
                 components.html(map_html, height=600)
 
@@ -468,31 +517,36 @@ def main():
         # Simulation loop
         if "live_data" not in st.session_state:
             st.session_state.live_data = []
+        # Running per-location, per-hour-of-week volume statistics for the live feed
+        if "live_detector" not in st.session_state:
+            st.session_state.live_detector = StreamingAnomalyDetector()
 
         if st.button("Start Monitoring"):
             st.info("Monitoring started... (Press Stop to end)")
+            model_id = tp.artifact_id()
+            lut = load_lookup_table(tuple(model_id) if model_id else None)
             stop_btn = st.button("Stop")
             
             while not stop_btn:
                 # Default simulated values (Aligned with Model)
-                # We construct a single-row DataFrame for the current moment
+                # Current conditions; the feature pipeline fills in time and defaults
                 now = datetime.now()
-                sim_input = pd.DataFrame({
-                    "hour": [now.hour],
-                    "day_of_week": [now.weekday()],
-                    "weather": [st.session_state.get("f_weather", 1)], 
-                    "lat": [lat],
-                    "lon": [lon],
-                    "event": [0],
-                    "wind": [st.session_state.get("f_wind", 10)],
-                    "precip": [st.session_state.get("f_precip", 0.0)],
-                    "visibility": [st.session_state.get("f_vis", 10)],
-                    "pollution": [20]
-                })
+                sim_weather = {
+                    "weather": st.session_state.get("f_weather", 1),
+                    "wind": st.session_state.get("f_wind", 10),
+                    "precip": st.session_state.get("f_precip", 0.0),
+                    "visibility": st.session_state.get("f_vis", 10),
+                    "pollution": 20
+                }
                 
                 # Get model prediction as baseline
                 try:
-                    base_vol = tp.predict(sim_input)[0]
+                    if lut is not None:
+                        row = tp.pipeline.transform_one(lat, lon, when=now, weather=sim_weather, event=0)[0]
+                        values = dict(zip(tp.pipeline.features, row.tolist()))
+                        base_vol = lut.lookup([values[f] for f in lut.features])
+                    else:
+                        base_vol = tp.predict_request(lat, lon, when=now, weather=sim_weather, event=0)
                 except:
                     base_vol = 1500 # Fallback
                 
@@ -523,6 +577,10 @@ def main():
                     if new_vol > 2000: status = "Congested"
                     elif new_vol < 500: status = "Free Flow"
 
+                _, is_anomaly = st.session_state.live_detector.update(lat, lon, now.hour, now.weekday(), new_vol)
+                if is_anomaly:
+                    status = "Anomaly"
+
                 # Update metrics
                 metric_vol.metric("Volume (Est)", f"{new_vol} veh/hr", delta=f"{np.random.randint(-20, 20)}")
                 metric_speed.metric("Avg Speed", f"{new_speed} km/h", delta=f"{np.random.randint(-2, 2)}")
@@ -530,6 +588,8 @@ def main():
                 
                 if status == "Congested":
                     metric_status.error(status)
+                elif status == "Anomaly":
+                    metric_status.warning("Unusual volume")
                 else:
                     metric_status.success(status)
                 
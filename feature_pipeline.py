@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from incident_integration import incident_flags
+
+# Used until `fit` has seen data; they match the dashboard's default inputs
+DEFAULTS = {
+    "hour": 12,
+    "day_of_week": 0,
+    "weather": 1,
+    "event": 0,
+    "wind": 10.0,
+    "precip": 0.0,
+    "visibility": 10.0,
+    "pollution": 20.0,
+}
+DISCRETE = ("hour", "day_of_week", "weather", "event")
+REQUIRED = ("lat", "lon")
+
+# fetch_current_weather() field names for the model's weather features
+WEATHER_KEYS = {
+    "weather": "weather_condition",
+    "wind": "wind_speed",
+    "precip": "precipitation",
+    "visibility": "visibility",
+    "pollution": "pollution",
+}
+
+def _weather_values(weather):
+    """
+    Maps a weather dict (model or Open-Meteo field names) to model features.
+    """
+    if weather is None:
+        return {}
+    values = {}
+    for feature, api_key in WEATHER_KEYS.items():
+        if feature in weather:
+            values[feature] = weather[feature]
+        elif api_key in weather:
+            values[feature] = weather[api_key]
+    return values
+
+class FeaturePipeline:
+    """
+    Assembles the model's float32 feature matrix from raw inputs, the same way
+    for a training batch and for a single serving request.
+
+    Each feature comes from the first available source: an explicit argument
+    (timestamps, a weather dict, incidents), a column of the input frame, or
+    the default learned by `fit`. lat/lon are always required.
+    """
+
+    def __init__(self, features, defaults=None, incident_radius_m=1000.0):
+        self.features = list(features)
+        self.defaults = dict(DEFAULTS)
+        self.defaults.update(defaults or {})
+        self.incident_radius_m = incident_radius_m
+
+    def fit(self, df):
+        """
+        Learns fallback values from training data: the mode of discrete
+        features and the median of continuous ones.
+        """
+        for f in self.features:
+            if f in REQUIRED or f not in df.columns or not len(df):
+                continue
+            col = df[f]
+            if f in DISCRETE:
+                self.defaults[f] = int(col.mode().iloc[0])
+            else:
+                self.defaults[f] = float(col.median())
+        return self
+
+    def transform(self, df=None, weather=None, incidents=None, timestamps=None, out=None):
+        """
+        Returns an (n, n_features) float32 matrix in `self.features` order.
+
+        `weather` maps feature (or Open-Meteo) names to scalars or per-row
+        arrays, `incidents` is a list of incident dicts turned into the event
+        flag, and `timestamps` (or a `timestamp` column) provides hour and
+        day_of_week.
+        """
+        df = df if df is not None else pd.DataFrame()
+        columns = df.columns
+        if timestamps is None and "timestamp" in columns and not {"hour", "day_of_week"} <= set(columns):
+            timestamps = df["timestamp"]
+        if len(columns):
+            n = len(df)
+        elif timestamps is not None:
+            n = len(np.atleast_1d(timestamps))
+        else:
+            n = 1
+
+        given = _weather_values(weather)
+        if timestamps is not None:
+            times = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(timestamps)))
+            given["hour"] = times.hour.to_numpy()
+            given["day_of_week"] = times.dayofweek.to_numpy()
+
+        if out is None:
+            out = np.empty((n, len(self.features)), dtype=np.float32)
+        for j, f in enumerate(self.features):
+            if f in given:
+                out[:, j] = given[f]
+            elif f in columns:
+                out[:, j] = df[f].to_numpy()
+            elif f in REQUIRED:
+                raise ValueError(f"Missing required feature: {f}")
+            else:
+                out[:, j] = self.defaults.get(f, 0)
+
+        if incidents is not None and "event" in self.features:
+            j = self.features.index("event")
+            lat = out[:, self.features.index("lat")]
+            lon = out[:, self.features.index("lon")]
+            # An event recorded in the data still counts
+            out[:, j] = np.maximum(out[:, j], incident_flags(lat, lon, incidents, self.incident_radius_m))
+        return out
+
+    def transform_one(self, lat, lon, when=None, weather=None, incidents=None, out=None, **values):
+        """
+        Fills one row (a new array, or the (1, n_features) buffer `out`) for
+        a single request without touching pandas. `when` is a datetime for
+        hour and day_of_week; keyword `values` override any feature.
+        """
+        given = _weather_values(weather)
+        if when is not None:
+            given["hour"] = when.hour
+            given["day_of_week"] = when.weekday()
+        if incidents is not None:
+            given["event"] = int(incident_flags([lat], [lon], incidents, self.incident_radius_m)[0])
+        given.update(values)
+        given["lat"] = lat
+        given["lon"] = lon
+
+        if out is None:
+            out = np.empty((1, len(self.features)), dtype=np.float32)
+        row = out[0]
+        for j, f in enumerate(self.features):
+            row[j] = given[f] if f in given else self.defaults.get(f, 0)
+        return out
+
+    def to_dict(self):
+        return {"features": self.features, "defaults": self.defaults, "incident_radius_m": self.incident_radius_m}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["features"], defaults=data.get("defaults"),
+                   incident_radius_m=data.get("incident_radius_m", 1000.0))
@@ -0,0 +1,33 @@
+import math
+import numpy as np
+
+# One spherical Earth for every distance, radius and grid calculation
+EARTH_RADIUS_M = 6_371_000.0
+EARTH_CIRCUMFERENCE_M = 2 * math.pi * EARTH_RADIUS_M
+M_PER_DEG_LAT = EARTH_CIRCUMFERENCE_M / 360.0
+
+def metres_to_degrees(metres, ref_lat):
+    """
+    (degrees of latitude, degrees of longitude) spanning `metres` at `ref_lat`.
+    """
+    return metres / M_PER_DEG_LAT, metres / (M_PER_DEG_LAT * np.cos(np.radians(ref_lat)))
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in metres; works on scalars and numpy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def bbox_for_radius(lat, lon, radius):
+    """
+    (min_lon, min_lat, max_lon, max_lat) of the smallest box holding every
+    point within `radius` metres (great-circle) of (lat, lon).
+    """
+    d = radius / EARTH_RADIUS_M
+    lat_delta = math.degrees(d)
+    # The circle is widest in longitude poleward of its centre, not at it
+    s = math.sin(min(d, math.pi / 2)) / max(math.cos(math.radians(lat)), 1e-12)
+    lon_delta = 180.0 if s >= 1 else math.degrees(math.asin(s))
+    return lon - lon_delta, max(lat - lat_delta, -90.0), lon + lon_delta, min(lat + lat_delta, 90.0)
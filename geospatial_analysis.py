@@ -1,29 +1,340 @@
 import pandas as pd
+import numpy as np
+import time
+from collections import Counter, deque
 from sklearn.cluster import DBSCAN
 import folium
+from traffic_store import read_traffic_data
+from geo_utils import EARTH_RADIUS_M, metres_to_degrees
 
-def find_hotspots(df):
+def grid_keys(lat, lon, cell_m, ref_lat):
+    """
+    Integer (row, col) indices of the ~`cell_m` metre grid cell of each
+    point. Longitude is scaled at `ref_lat`, so cells stay square nearby.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    deg_lat, deg_lon = metres_to_degrees(cell_m, ref_lat)
+    return np.floor(lat / deg_lat).astype(np.int64), np.floor(lon / deg_lon).astype(np.int64)
+
+def _unique_cells(rows, cols):
+    """
+    Returns (first, inverse, counts) over the distinct (row, col) cells.
+    """
+    # One int64 key per cell; np.unique on a 1-D array is much faster than on row pairs
+    cols = cols - cols.min()
+    keys = (rows - rows.min()) * (int(cols.max()) + 1) + cols
+    _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    return first, inverse, counts
+
+def grid_cells(lat, lon, cell_m, ref_lat=None):
+    """
+    Bins points into grid cells. Returns (inverse, counts, center_lat,
+    center_lon): the cell of every point, then per cell the number of points
+    and their centroid.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if ref_lat is None:
+        ref_lat = float(lat.mean())
+    _, inverse, counts = _unique_cells(*grid_keys(lat, lon, cell_m, ref_lat))
+    center_lat = np.bincount(inverse, weights=lat) / counts
+    center_lon = np.bincount(inverse, weights=lon) / counts
+    return inverse, counts, center_lat, center_lon
+
+def find_hotspots(df, method="dbscan", eps_m=1000.0, min_samples=2, cell_m=None):
+    """
+    Returns a copy of `df` with a 'hotspot' cluster label per row (-1 = noise).
+
+    method="dbscan" clusters the raw coordinates with eps=0.01 degrees.
+    method="grid" scales to millions of rows: points are binned into
+    `cell_m` metre cells (default eps_m / 4) and the cell centroids are
+    clustered with a haversine ball tree at `eps_m` metres, weighted by the
+    number of points in each cell, so `min_samples` still counts points.
+    """
+    if method not in ("dbscan", "grid"):
+        raise ValueError(f"Unknown hotspot method '{method}', choose 'dbscan' or 'grid'")
     if df.empty:
         return df
     
     coords = df[["lat", "lon"]].values
     # Check if we have enough data for DBSCAN
     if len(coords) < 5:
-        df['hotspot'] = -1
-        return df
+        return df.assign(hotspot=-1)
 
     try:
-        clustering = DBSCAN(eps=0.01, min_samples=2).fit(coords)
-        df['hotspot'] = clustering.labels_
+        if method == "grid":
+            inverse, counts, center_lat, center_lon = grid_cells(coords[:, 0], coords[:, 1], cell_m or eps_m / 4)
+            clustering = DBSCAN(eps=eps_m / EARTH_RADIUS_M, min_samples=min_samples, metric="haversine",
+                                algorithm="ball_tree")
+            clustering.fit(np.radians(np.column_stack([center_lat, center_lon])), sample_weight=counts)
+            labels = clustering.labels_[inverse]
+        else:
+            labels = DBSCAN(eps=0.01, min_samples=min_samples).fit(coords).labels_
     except Exception as e:
         print(f"Clustering failed: {e}")
-        df['hotspot'] = -1
-        
-    return df
+        labels = -1
+
+    return df.assign(hotspot=labels)
+
+class HotspotTracker:
+    """
+    Keeps hotspots up to date over a sliding time window of observations.
+
+    Points are binned into `cell_m` metre grid cells. A cell is hot while it
+    holds at least `min_count` points from the last `window_s` seconds, and a
+    hotspot is a group of touching hot cells (8-neighbourhood). Adding or
+    expiring points only changes counters; clusters are recomputed only around
+    cells that turned hot or cold, and keep their ids across updates.
+    """
+
+    def __init__(self, cell_m=250.0, window_s=900.0, min_count=5, ref_lat=40.7128):
+        self.cell_m = cell_m
+        self.window_s = window_s
+        self.min_count = min_count
+        self.ref_lat = ref_lat
+        self.points = deque()  # (time, cell) in arrival order
+        self.counts = Counter()
+        self.hot = set()
+        self.cell_cluster = {}
+        self.clusters = {}  # id -> set of cells
+        self._next_id = 0
+        self._flipped = set()
+
+    def _cells(self, lat, lon):
+        rows, cols = grid_keys(np.atleast_1d(lat), np.atleast_1d(lon), self.cell_m, self.ref_lat)
+        return list(zip(rows.tolist(), cols.tolist()))
 
-def visualize_hotspots(df):
+    def _count_changed(self, cell):
+        if (self.counts[cell] >= self.min_count) != (cell in self.hot):
+            self._flipped.add(cell)
+
+    def add(self, lat, lon, times=None):
+        """
+        Adds one or more points (scalars or arrays) observed at `times`
+        (default now). Times are expected in non-decreasing order.
+        """
+        cells = self._cells(lat, lon)
+        if times is None:
+            times = [time.time()] * len(cells)
+        for t, cell in zip(np.broadcast_to(times, len(cells)).tolist(), cells):
+            self.points.append((t, cell))
+            self.counts[cell] += 1
+            self._count_changed(cell)
+
+    def expire(self, now=None):
+        """
+        Drops points older than the window.
+        """
+        cutoff = (time.time() if now is None else now) - self.window_s
+        while self.points and self.points[0][0] < cutoff:
+            _, cell = self.points.popleft()
+            self.counts[cell] -= 1
+            if not self.counts[cell]:
+                del self.counts[cell]
+            self._count_changed(cell)
+
+    def update(self, lat=None, lon=None, times=None, now=None):
+        """
+        Adds new points, expires old ones and returns the resulting list of
+        change events (dicts with a 'type' of new, grow, shrink, merge, split
+        or retire, the cluster 'id' and its current size).
+        """
+        if lat is not None:
+            self.add(lat, lon, times)
+        self.expire(now)
+        return self._recluster()
+
+    def _neighbours(self, cell):
+        r, c = cell
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                if dr or dc:
+                    yield (r + dr, c + dc)
+
+    def _recluster(self):
+        flipped = {c for c in self._flipped if (self.counts.get(c, 0) >= self.min_count) != (c in self.hot)}
+        self._flipped.clear()
+        if not flipped:
+            return []
+
+        # Old clusters that contain or touch a flipped cell are the only ones that can change
+        affected = set()
+        for cell in flipped:
+            for nb in (cell, *self._neighbours(cell)):
+                if nb in self.cell_cluster:
+                    affected.add(self.cell_cluster[nb])
+        for cell in flipped:
+            if cell in self.hot:
+                self.hot.discard(cell)
+            else:
+                self.hot.add(cell)
+
+        seeds = {c for cid in affected for c in self.clusters[cid]} | flipped
+        seen, components = set(), []
+        for seed in seeds:
+            if seed in seen or seed not in self.hot:
+                continue
+            seen.add(seed)
+            component, stack = {seed}, [seed]
+            while stack:
+                for nb in self._neighbours(stack.pop()):
+                    if nb in self.hot and nb not in seen:
+                        seen.add(nb)
+                        component.add(nb)
+                        stack.append(nb)
+            components.append(component)
+
+        old_sizes = {cid: len(self.clusters[cid]) for cid in affected}
+        previous = {}
+        for cid in affected:
+            for cell in self.clusters.pop(cid):
+                previous[cell] = cid
+                del self.cell_cluster[cell]
+
+        # Each component keeps the id of the old cluster it overlaps most; largest components choose first
+        overlaps = [Counter(previous[c] for c in component if c in previous) for component in components]
+        order = sorted(range(len(components)), key=lambda i: -len(components[i]))
+        claimed, ids = set(), {}
+        for i in order:
+            # Ties go to the larger, then older, cluster
+            free = sorted((cid for cid in overlaps[i] if cid not in claimed),
+                          key=lambda cid: (-overlaps[i][cid], -old_sizes[cid], cid))
+            if free:
+                ids[i] = free[0]
+                claimed.add(free[0])
+            else:
+                ids[i] = self._next_id
+                self._next_id += 1
+
+        events = []
+        split_into = {}
+        for i in order:
+            cid, component = ids[i], components[i]
+            self.clusters[cid] = component
+            for cell in component:
+                self.cell_cluster[cell] = cid
+            old_ids = set(overlaps[i])
+            if not old_ids:
+                events.append(self._event("new", cid))
+                continue
+            for old in old_ids - {cid}:
+                if old in claimed:
+                    # Part of a cluster that kept its id elsewhere
+                    split_into.setdefault(old, []).append(cid)
+            absorbed = sorted(old for old in old_ids - {cid} if old not in claimed)
+            if cid not in old_ids:
+                continue
+            if absorbed:
+                events.append(self._event("merge", cid, absorbed=absorbed))
+            elif len(component) != old_sizes[cid]:
+                events.append(self._event("grow" if len(component) > old_sizes[cid] else "shrink", cid))
+        # A split already reports the new size of the cluster that kept its id
+        events = [e for e in events if not (e["type"] == "shrink" and e["id"] in split_into)]
+        for old, into in split_into.items():
+            events.append(self._event("split", old, into=sorted(set(into))))
+        merged = {old for e in events if e["type"] == "merge" for old in e["absorbed"]}
+        for cid in sorted(affected - claimed - merged):
+            events.append({"type": "retire", "id": cid, "cells": 0, "points": 0})
+        return events
+
+    def labels(self, lat, lon):
+        """
+        Current hotspot id of each point's cell, -1 outside any hotspot.
+        """
+        return np.array([self.cell_cluster.get(cell, -1) for cell in self._cells(lat, lon)], dtype=np.int64)
+
+    def hotspots(self):
+        """
+        One row per current hotspot: id, cells, points and the
+        point-weighted centre.
+        """
+        deg_lat, deg_lon = metres_to_degrees(self.cell_m, self.ref_lat)
+        rows = []
+        for cid, cells in self.clusters.items():
+            keys = np.array(list(cells), dtype=np.float64)
+            weights = np.array([self.counts[c] for c in cells], dtype=np.float64)
+            rows.append({
+                "id": cid,
+                "cells": len(cells),
+                "points": int(weights.sum()),
+                "lat": float(np.average((keys[:, 0] + 0.5) * deg_lat, weights=weights)),
+                "lon": float(np.average((keys[:, 1] + 0.5) * deg_lon, weights=weights)),
+            })
+        return pd.DataFrame(rows, columns=["id", "cells", "points", "lat", "lon"])
+
+    def _event(self, kind, cid, **extra):
+        cells = self.clusters[cid]
+        points = sum(self.counts[c] for c in cells)
+        event = {"type": kind, "id": cid, "cells": len(cells), "points": points}
+        event.update(extra)
+        return event
+
+def _aggregate_layer(df, cell_m, max_features):
+    """
+    A single GeoJson layer of grid cells covering the points in `df`. The cell
+    size doubles from `cell_m` until there are at most `max_features` cells.
+    Rows are binned once; coarser grids are built from the per-cell sums, so
+    only the first pass scales with the number of rows.
+    """
+    lat = df["lat"].to_numpy(dtype=np.float64)
+    lon = df["lon"].to_numpy(dtype=np.float64)
+    ref_lat = float(lat.mean())
+    rows, cols = grid_keys(lat, lon, cell_m, ref_lat)
+    first, inverse, counts = _unique_cells(rows, cols)
+    rows, cols = rows[first], cols[first]
+    counts = counts.astype(np.float64)
+    if "traffic_volume" in df.columns:
+        volume = np.bincount(inverse, weights=df["traffic_volume"].to_numpy(dtype=np.float64))
+    else:
+        volume = np.full(len(counts), np.nan)
+    if "hotspot" in df.columns:
+        hot = np.bincount(inverse, weights=(df["hotspot"].to_numpy() != -1))
+    else:
+        hot = np.zeros(len(counts))
+
+    while len(counts) > max_features:
+        # floor(floor(x / d) / 2) == floor(x / 2d), so halving the keys doubles the cell size
+        cell_m *= 2
+        first, inverse, _ = _unique_cells(rows // 2, cols // 2)
+        rows, cols = rows[first] // 2, cols[first] // 2
+        counts, volume, hot = (np.bincount(inverse, weights=w) for w in (counts, volume, hot))
+
+    deg_lat, deg_lon = metres_to_degrees(cell_m, ref_lat)
+    south = np.round(rows * deg_lat, 6)
+    west = np.round(cols * deg_lon, 6)
+    north = np.round(south + deg_lat, 6)
+    east = np.round(west + deg_lon, 6)
+    volume = np.rint(volume / counts)
+    hot_share = hot / counts
+    counts = counts.astype(np.int64)
+    # Denser cells are drawn more opaque
+    opacity = np.round(0.25 + 0.5 * np.log1p(counts) / np.log1p(counts.max()), 2)
+
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]]},
+            "properties": {"points": c, "traffic_volume": None if v != v else int(v),
+                           "color": "red" if h >= 0.5 else "blue", "opacity": o},
+        }
+        for s, w, n, e, c, v, h, o in zip(south.tolist(), west.tolist(), north.tolist(), east.tolist(),
+                                          counts.tolist(), volume.tolist(), hot_share.tolist(), opacity.tolist())
+    ]
+    return folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda f: {"fillColor": f["properties"]["color"], "color": f["properties"]["color"],
+                                  "weight": 0, "fillOpacity": f["properties"]["opacity"]},
+        tooltip=folium.GeoJsonTooltip(fields=["points", "traffic_volume"], aliases=["Points", "Traffic"]),
+    )
+
+def visualize_hotspots(df, mode="markers", max_features=2000, cell_m=100.0):
     """
     Generates a Folium map with hotspots marked.
+    mode="markers" draws one marker per row. mode="aggregate" draws at most
+    `max_features` grid cells (starting at `cell_m` metres, coarsened as
+    needed) in one GeoJson layer, so the map size is bounded however many
+    rows go in; cells where most points are in a hotspot are red.
     Returns the map object.
     """
     if df.empty:
@@ -32,6 +343,12 @@ def visualize_hotspots(df):
     center_lat = df["lat"].mean()
     center_lon = df["lon"].mean()
     m = folium.Map(location=[center_lat, center_lon], zoom_start=13)
+
+    if mode == "aggregate":
+        _aggregate_layer(df, cell_m, max_features).add_to(m)
+        return m
+    if mode != "markers":
+        raise ValueError(f"Unknown map mode '{mode}', choose 'markers' or 'aggregate'")
     
     for _, row in df.iterrows():
         # Only plot if we have hotspot info, default to blue if not a hotspot
@@ -52,7 +369,7 @@ def visualize_hotspots(df):
 
 if __name__ == "__main__":
     try:
-        df = pd.read_csv("sample_data.csv")
+        df = read_traffic_data("sample_data.csv", columns=["lat", "lon", "traffic_volume"])
         df = find_hotspots(df)
         m = visualize_hotspots(df)
         m.save("hotspots_map.html")
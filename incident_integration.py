@@ -1,5 +1,11 @@
 import pandas as pd
+import numpy as np
 import random
+from sklearn.neighbors import KDTree
+from traffic_store import read_traffic_data
+from geo_utils import EARTH_RADIUS_M
+
+SEVERITY_LEVELS = {"Low": 1, "Medium": 2, "Moderate": 2, "High": 3}
 
 def fetch_incidents():
     """
@@ -16,23 +22,64 @@ def fetch_incidents():
     ]
     return incidents
 
-def add_incident_feature(df, incidents):
-    """
-    Adds an 'event' feature to the dataframe based on proximity to incidents.
-    """
-    df['event'] = 0
-    if not incidents:
-        return df
-        
-    for inc in incidents:
-        # Simple proximity check (approx 1km radius)
-        near = ((abs(df['lat'] - inc['lat']) < 0.01) & (abs(df['lon'] - inc['lon']) < 0.01))
-        df.loc[near, 'event'] = 1
-    return df
+def _unit_xyz(lat, lon):
+    # Straight-line distance between points on the unit sphere grows with the great-circle distance
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def incident_join(lat, lon, incidents, radius_m=1000.0, batch_rows=1_000_000):
+    """
+    Tags points with their nearest incident in one pass over a KD-tree built
+    once over the incidents (as 3-D unit vectors, so great-circle distances
+    are exact anywhere on Earth). Returns a DataFrame with
+    incident_distance_m (NaN without incidents), incident_severity of the
+    nearest incident (0 = none, 1 = low .. 3 = high) and incidents_nearby
+    within `radius_m`.
+    """
+    lat = np.asarray(lat, dtype=np.float64).ravel()
+    lon = np.asarray(lon, dtype=np.float64).ravel()
+    n = len(lat)
+    distance = np.full(n, np.nan)
+    severity = np.zeros(n, dtype=np.int8)
+    nearby = np.zeros(n, dtype=np.int32)
+    if incidents:
+        coords = _unit_xyz([inc["lat"] for inc in incidents], [inc["lon"] for inc in incidents])
+        levels = np.array([SEVERITY_LEVELS.get(inc.get("severity"), 1) for inc in incidents], dtype=np.int8)
+        tree = KDTree(coords)
+        chord_radius = 2 * np.sin(radius_m / EARTH_RADIUS_M / 2)
+        # Batches bound the temporary arrays for very large frames
+        for start in range(0, n, batch_rows):
+            points = _unit_xyz(lat[start:start + batch_rows], lon[start:start + batch_rows])
+            chord, idx = tree.query(points, k=1)
+            distance[start:start + len(points)] = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord[:, 0] / 2, 1.0))
+            severity[start:start + len(points)] = levels[idx[:, 0]]
+            nearby[start:start + len(points)] = tree.query_radius(points, r=chord_radius, count_only=True)
+    return pd.DataFrame({"incident_distance_m": distance, "incident_severity": severity,
+                         "incidents_nearby": nearby})
+
+def incident_flags(lat, lon, incidents, radius_m=1000.0):
+    """
+    Returns an int8 array that is 1 where (lat, lon) is within `radius_m`
+    metres of any incident.
+    """
+    joined = incident_join(lat, lon, incidents, radius_m)
+    return (joined["incidents_nearby"].to_numpy() > 0).astype(np.int8)
+
+def add_incident_feature(df, incidents, radius_m=1000.0):
+    """
+    Returns a copy of the dataframe with an 'event' feature (an incident within
+    `radius_m` metres) plus the nearest incident's distance and severity and
+    the number of incidents nearby.
+    """
+    joined = incident_join(df['lat'].to_numpy(), df['lon'].to_numpy(), incidents, radius_m)
+    joined.index = df.index
+    event = (joined["incidents_nearby"] > 0).astype(np.int8)
+    return df.assign(event=event, **{c: joined[c] for c in joined.columns})
 
 if __name__ == "__main__":
     try:
-        df = pd.read_csv("sample_data.csv")
+        df = read_traffic_data("sample_data.csv")
         incidents = fetch_incidents()
         print(f"Fetched {len(incidents)} incidents.")
         df = add_incident_feature(df, incidents)
@@ -0,0 +1,92 @@
+import numpy as np
+import json
+from bisect import bisect_right
+
+class LookupTable:
+    """
+    A model distilled into a dense array over a discretized feature space.
+
+    Every feature has a sorted list of grid values (`axes`). An input is
+    snapped to the nearest grid value on each axis and the prediction is read
+    from one flat array, so a lookup is a handful of bisects plus one index.
+    Only NumPy is needed to load and query a table.
+    """
+
+    def __init__(self, features, axes, values):
+        self.features = list(features)
+        self.axes = [np.asarray(a, dtype=np.float64) for a in axes]
+        self.values = np.ascontiguousarray(values, dtype=np.float32).reshape([len(a) for a in self.axes])
+        # Midpoints between neighbouring grid values are the bin boundaries
+        self._bounds = [((a[1:] + a[:-1]) / 2).tolist() for a in self.axes]
+        self._strides = [int(s // self.values.itemsize) for s in self.values.strides]
+        self._flat = memoryview(self.values.reshape(-1))
+        self.error = {}
+        # Identity of the model artifact the table was distilled from (see TrafficPredictor.artifact_id)
+        self.source = None
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def lookup(self, row):
+        """
+        Prediction for one row given in `self.features` order.
+        """
+        idx = 0
+        for v, bounds, stride in zip(row, self._bounds, self._strides):
+            idx += bisect_right(bounds, v) * stride
+        return self._flat[idx]
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        idx = np.zeros(X.shape[0], dtype=np.intp)
+        for j, (bounds, stride) in enumerate(zip(self._bounds, self._strides)):
+            idx += np.searchsorted(np.asarray(bounds), X[:, j], side="right") * stride
+        return self.values.reshape(-1)[idx].astype(np.float64)
+
+    def save(self, path):
+        np.savez(path, values=self.values, features=np.array(self.features), source=np.array(json.dumps(self.source)),
+                 **{f"axis_{i}": a for i, a in enumerate(self.axes)})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            features = data["features"].tolist()
+            axes = [data[f"axis_{i}"] for i in range(len(features))]
+            table = cls(features, axes, data["values"])
+            if "source" in data.files:
+                table.source = json.loads(str(data["source"]))
+            return table
+
+def build_lookup_table(predict_fn, features, axes, batch_rows=200_000):
+    """
+    Evaluates `predict_fn` on every point of the grid spanned by `axes`
+    (one array of grid values per feature) and returns a LookupTable.
+    """
+    axes = [np.asarray(a, dtype=np.float64) for a in axes]
+    shape = tuple(len(a) for a in axes)
+    n_cells = int(np.prod(shape))
+    print(f"Evaluating model on {n_cells} grid cells {shape}...")
+    values = np.empty(n_cells, dtype=np.float32)
+    for start in range(0, n_cells, batch_rows):
+        flat = np.arange(start, min(start + batch_rows, n_cells))
+        idx = np.unravel_index(flat, shape)
+        grid = np.column_stack([a[i] for a, i in zip(axes, idx)])
+        values[start:start + len(flat)] = predict_fn(grid)
+    return LookupTable(features, axes, values.reshape(shape))
+
+def quantile_axis(values, n_bins):
+    """
+    `n_bins` grid values at the bin centres of equal-frequency bins.
+    """
+    qs = (np.arange(n_bins) + 0.5) / n_bins
+    return np.unique(np.quantile(np.asarray(values, dtype=np.float64), qs))
+
+def uniform_axis(values, n_bins, trim=0.01):
+    """
+    Centres of `n_bins` equal-width bins across the central range of `values`.
+    """
+    lo, hi = np.quantile(np.asarray(values, dtype=np.float64), [trim, 1 - trim])
+    return lo + (np.arange(n_bins) + 0.5) * (hi - lo) / n_bins
@@ -0,0 +1,210 @@
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from traffic_predictor import TrafficPredictor
+
+class MicroBatcher:
+    """
+    Collects concurrent prediction requests into micro-batches.
+
+    A single worker thread waits for the first pending request, then keeps
+    collecting for at most `max_wait_ms` (or until `max_batch_size` rows are
+    queued) and scores everything with one `predict_fn` call.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=256, max_wait_ms=3.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = deque()
+        self._queued_rows = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {"requests": 0, "rows": 0, "batches": 0, "max_batch_rows": 0, "max_queue_depth": 0,
+                       "errors": 0, "predict_seconds": 0.0}
+        self._batch_sizes = deque(maxlen=1000)
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, rows):
+        """
+        Queues a 2-D array of rows and returns a Future of their predictions.
+        """
+        rows = np.asarray(rows, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.append((rows, future))
+            self._queued_rows += len(rows)
+            self._stats["requests"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            self._cond.notify()
+        return future
+
+    def predict(self, rows, timeout=None):
+        return self.submit(rows).result(timeout)
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            deadline = time.monotonic() + self.max_wait
+            while self._queued_rows < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, n_rows = [], 0
+            # Always take at least one request, even if it alone exceeds max_batch_size
+            while self._queue and (not batch or n_rows + len(self._queue[0][0]) <= self.max_batch_size):
+                rows, future = self._queue.popleft()
+                batch.append((rows, future))
+                n_rows += len(rows)
+            self._queued_rows -= n_rows
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            X = np.concatenate([rows for rows, _ in batch]) if len(batch) > 1 else batch[0][0]
+            start = time.perf_counter()
+            try:
+                preds = np.asarray(self.predict_fn(X), dtype=np.float64)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                with self._cond:
+                    self._stats["errors"] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            offset = 0
+            for rows, future in batch:
+                future.set_result(preds[offset:offset + len(rows)])
+                offset += len(rows)
+            with self._cond:
+                self._stats["batches"] += 1
+                self._stats["rows"] += len(X)
+                self._stats["max_batch_rows"] = max(self._stats["max_batch_rows"], len(X))
+                self._stats["predict_seconds"] += elapsed
+                self._batch_sizes.append(len(X))
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._queue)
+            stats["queued_rows"] = self._queued_rows
+            stats["mean_batch_rows"] = stats["rows"] / stats["batches"] if stats["batches"] else 0.0
+            stats["recent_mean_batch_rows"] = float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0
+            stats["max_wait_ms"] = self.max_wait * 1000
+            stats["max_batch_size"] = self.max_batch_size
+            return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of concurrent clients overflow the default listen backlog of 5
+    request_queue_size = 1024
+
+def rows_from_json(payload, features):
+    """
+    Accepts one object of feature values or a list of them and returns an
+    (n, len(features)) float32 matrix in model feature order.
+    """
+    records = payload if isinstance(payload, list) else [payload]
+    missing = sorted({f for r in records for f in features if f not in r})
+    if missing:
+        raise ValueError(f"Missing features in request: {missing}")
+    return np.array([[r[f] for f in features] for r in records], dtype=np.float32)
+
+def make_handler(batcher, features):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, batcher.stats())
+            elif self.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path not in ("/predict", "/predict/batch"):
+                self._send(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"null")
+                if self.path == "/predict/batch" and isinstance(payload, dict):
+                    payload = payload.get("rows", [])
+                rows = rows_from_json(payload, features)
+            except (ValueError, TypeError, AttributeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            try:
+                preds = batcher.predict(rows).tolist()
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            if self.path == "/predict":
+                self._send(200, {"prediction": preds[0]})
+            else:
+                self._send(200, {"predictions": preds})
+
+        def log_message(self, format, *args):
+            # Per-request logging would dominate at high request rates
+            pass
+
+    return PredictionHandler
+
+def serve(host="127.0.0.1", port=8000, model_path="traffic_model.pkl", max_batch_size=256, max_wait_ms=3.0):
+    tp = TrafficPredictor(model_path)
+    if not tp.is_trained:
+        raise Exception(f"No trained model found at {model_path}")
+    tp.compile()
+    batcher = MicroBatcher(tp.predict_array, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = PredictionServer((host, port), make_handler(batcher, tp.features))
+    print(f"Serving predictions on http://{host}:{server.server_port} "
+          f"(batches of up to {max_batch_size} rows, {max_wait_ms} ms wait)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local micro-batching prediction server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default="traffic_model.pkl")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=3.0)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.model, args.max_batch_size, args.max_wait_ms)
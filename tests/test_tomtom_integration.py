@@ -0,0 +1,92 @@
+from collections import Counter
+
+from cache_utils import TTLCache
+from tomtom_integration import (FLOW_PATH, INCIDENT_MAX_ZOOM, INCIDENT_PATH, bbox_for_radius, fetch_real_time_incidents,
+                                fetch_real_time_traffic, fetch_traffic_batch, zoom_for_radius)
+
+def _flow(query):
+    # Echo the queried latitude back as the current speed
+    lat = float(query["point"].split(",")[0])
+    return {"flowSegmentData": {"currentSpeed": lat, "freeFlowSpeed": 100, "confidence": 1}}
+
+def test_pooled_fetch_keeps_order_and_reuses_connections(stub_server):
+    stub_server.respond = lambda path, query: (200, _flow(query))
+    points = [(float(i), -74.0) for i in range(40)]
+    results = fetch_traffic_batch("KEY", points, max_workers=4, base_url=stub_server.url)
+
+    assert [r["current_speed"] for r in results] == list(range(40))
+    assert len(stub_server.requests) == 40
+    assert all(path == FLOW_PATH and query["key"] == "KEY" for path, query in stub_server.requests)
+    # Keep-alive: no more connections than concurrent workers
+    assert len(stub_server.connections) <= 4
+
+def test_identical_points_are_fetched_once(stub_server):
+    stub_server.respond = lambda path, query: (200, _flow(query))
+    results = fetch_traffic_batch("KEY", [(1.0, 2.0), (3.0, 4.0), (1.0, 2.0)], base_url=stub_server.url)
+    assert len(stub_server.requests) == 2
+    assert results[0] == results[2]
+
+def test_retries_server_errors(stub_server):
+    attempts = Counter()
+    def respond(path, query):
+        attempts[query["point"]] += 1
+        # Every point fails once before succeeding
+        return (503, {}) if attempts[query["point"]] == 1 else (200, _flow(query))
+    stub_server.respond = respond
+
+    results = fetch_traffic_batch("KEY", [(1.0, 0.0), (2.0, 0.0)], retries=2, backoff=0, base_url=stub_server.url)
+    assert [r["current_speed"] for r in results] == [1, 2]
+    assert len(stub_server.requests) == 4
+
+def test_gives_up_after_retries_and_skips_client_errors(stub_server):
+    stub_server.respond = lambda path, query: (503, {})
+    assert fetch_traffic_batch("KEY", [(1.0, 0.0)], retries=2, backoff=0, base_url=stub_server.url) == [None]
+    assert len(stub_server.requests) == 3
+
+    stub_server.requests.clear()
+    stub_server.respond = lambda path, query: (403, {})
+    assert fetch_traffic_batch("KEY", [(1.0, 0.0)], retries=2, backoff=0, base_url=stub_server.url) == [None]
+    assert len(stub_server.requests) == 1
+
+def test_single_lookup_is_not_retried(stub_server):
+    stub_server.respond = lambda path, query: (503, {})
+    assert fetch_real_time_traffic("KEY", 40.7, -74.0, base_url=stub_server.url) is None
+    assert len(stub_server.requests) == 1
+
+def test_proximity_dedupe_is_opt_in(stub_server):
+    stub_server.respond = lambda path, query: (200, _flow(query))
+    # Three points within ~20 m of each other
+    points = [(40.71201, -74.00601), (40.71211, -74.00611), (40.71221, -74.00621)]
+
+    fetch_traffic_batch("KEY", points, base_url=stub_server.url)
+    assert len(stub_server.requests) == 3
+
+    stub_server.requests.clear()
+    results = fetch_traffic_batch("KEY", points, proximity_dedupe_deg=0.0005, base_url=stub_server.url)
+    assert len(stub_server.requests) == 1
+    # Every point shares the first point's reading
+    assert results[0] == results[1] == results[2]
+
+def _incident(id, coords):
+    geometry_type = "Point" if isinstance(coords[0], float) else "LineString"
+    return {"type": "Feature", "geometry": {"type": geometry_type, "coordinates": coords},
+            "properties": {"id": id, "iconCategory": 6, "magnitudeOfDelay": 3, "events": [{"description": id}]}}
+
+def test_incidents_overlapping_the_area_are_kept(stub_server):
+    lat, lon, radius = 40.7128, -74.0060, 1000
+    min_lon, min_lat, max_lon, max_lat = bbox_for_radius(lat, lon, radius)
+    incidents = [
+        _incident("inside", [lon, lat]),
+        # A closure that starts west of the area and runs through it
+        _incident("through", [[min_lon - 0.02, lat], [min_lon - 0.01, lat], [max_lon + 0.01, lat]]),
+        _incident("outside", [[max_lon + 0.01, max_lat + 0.01], [max_lon + 0.02, max_lat + 0.02]]),
+    ]
+    stub_server.respond = lambda path, query: (200, {"incidents": incidents})
+
+    found = fetch_real_time_incidents("KEY", lat, lon, radius=radius, cache=TTLCache(), base_url=stub_server.url)
+    assert sorted(inc["id"] for inc in found) == ["inside", "through"]
+    assert {path for path, _ in stub_server.requests} == {INCIDENT_PATH}
+
+def test_zero_radius_uses_the_deepest_zoom():
+    assert zoom_for_radius(40.7, 0) == INCIDENT_MAX_ZOOM
+    assert zoom_for_radius(40.7, 5000) < INCIDENT_MAX_ZOOM
@@ -0,0 +1,50 @@
+import pytest
+
+from cache_utils import TTLCache
+from weather_integration import fetch_weather_batch
+
+def _locations(query):
+    # One Open-Meteo location per requested coordinate, echoing its latitude as the temperature
+    lats = query["latitude"].split(",")
+    locations = [{"current": {"temperature_2m": float(lat), "weather_code": 61}, "hourly": {}} for lat in lats]
+    return locations[0] if len(locations) == 1 else locations
+
+def test_batches_distinct_cells(stub_server):
+    stub_server.respond = lambda path, query: (200, _locations(query))
+    # 250 cells, each queried twice
+    points = [(40.0 + i * 0.05 + 0.01, -74.01) for i in range(250)] * 2
+    results = fetch_weather_batch(points, base_url=stub_server.url, cache=TTLCache(), batch_size=100)
+
+    assert len(stub_server.requests) == 3
+    assert sorted(len(q["latitude"].split(",")) for _, q in stub_server.requests) == [50, 100, 100]
+    assert all(r["weather_condition"] == 3 for r in results)
+    # Each point gets its own cell's weather, in input order
+    assert [r["temperature"] for r in results[:3]] == pytest.approx([40.025, 40.075, 40.125])
+    assert results[:250] == results[250:]
+
+def test_cached_cells_are_not_fetched_again(stub_server):
+    stub_server.respond = lambda path, query: (200, _locations(query))
+    cache = TTLCache()
+    first = fetch_weather_batch([(40.71, -73.99), (40.81, -73.91)], base_url=stub_server.url, cache=cache)
+    assert len(stub_server.requests) == 1
+
+    # Same cells, different points inside them
+    second = fetch_weather_batch([(40.72, -73.98), (40.82, -73.92)], base_url=stub_server.url, cache=cache)
+    assert len(stub_server.requests) == 1
+    assert second == first
+    assert cache.hits == 2
+
+    # Only the new cell is requested
+    fetch_weather_batch([(40.71, -73.99), (41.51, -73.01)], base_url=stub_server.url, cache=cache)
+    assert len(stub_server.requests) == 2
+    assert len(stub_server.requests[1][1]["latitude"].split(",")) == 1
+
+def test_failed_batch_is_not_cached(stub_server):
+    stub_server.respond = lambda path, query: (500, {"error": True})
+    cache = TTLCache()
+    assert fetch_weather_batch([(40.71, -74.0)], base_url=stub_server.url, cache=cache) == [None]
+    assert len(cache) == 0
+
+    stub_server.respond = lambda path, query: (200, _locations(query))
+    assert fetch_weather_batch([(40.71, -74.0)], base_url=stub_server.url, cache=cache)[0] is not None
+    assert len(stub_server.requests) == 2
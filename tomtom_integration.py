@@ -1,111 +1,271 @@
 import requests
+import math
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def fetch_real_time_traffic(api_key, lat, lon):
+from cache_utils import TTLCache, get_session
+from geo_utils import EARTH_CIRCUMFERENCE_M, bbox_for_radius
+
+TOMTOM_BASE_URL = "https://api.tomtom.com"
+FLOW_PATH = "/traffic/services/4/flowSegmentData/absolute/10/json"
+
+class _RetryableStatus(Exception):
+    pass
+
+def _parse_flow(data):
+    flow_data = data.get("flowSegmentData", {})
+
+    # Extract relevant metrics
+    current_speed = flow_data.get("currentSpeed", 0) # km/h
+    free_flow_speed = flow_data.get("freeFlowSpeed", 0) # km/h
+    confidence = flow_data.get("confidence", 0)
+
+    # Calculate congestion level (0 to 100%)
+    # If current speed is near free flow, congestion is low.
+    if free_flow_speed > 0:
+        congestion = max(0, min(100, (1 - (current_speed / free_flow_speed)) * 100))
+    else:
+        congestion = 0
+
+    return {
+        "current_speed": int(current_speed),
+        "free_flow_speed": int(free_flow_speed),
+        "congestion_level": int(congestion),
+        "confidence": confidence
+    }
+
+def _fetch_flow(session, url, api_key, lat, lon, timeout, retries, backoff):
+    params = {
+        "key": api_key,
+        "point": f"{lat},{lon}"
+    }
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+            # Rate limiting and server errors are worth another try, other errors are not
+            if response.status_code == 429 or response.status_code >= 500:
+                raise _RetryableStatus(f"HTTP {response.status_code}")
+            response.raise_for_status()
+            return _parse_flow(response.json())
+        except (requests.ConnectionError, requests.Timeout, _RetryableStatus) as e:
+            if attempt == retries:
+                print(f"TomTom API Error: {e}")
+                return None
+            time.sleep(backoff * 2 ** attempt)
+        except Exception as e:
+            print(f"TomTom API Error: {e}")
+            return None
+
+def fetch_traffic_batch(api_key, points, max_workers=32, proximity_dedupe_deg=None, timeout=5, retries=2,
+                        backoff=0.25, base_url=TOMTOM_BASE_URL):
+    """
+    Fetches traffic flow for many (lat, lon) points concurrently and returns
+    the results (dicts as from fetch_real_time_traffic, or None) in input order.
+
+    Identical points are fetched once. With `proximity_dedupe_deg` (e.g.
+    0.0005, ~50 m), all points in the same grid square of that size share one
+    request instead. That cuts API calls for dense inputs, but it is
+    proximity, not road-segment matching: a point on a parallel or crossing
+    road in the same square gets the other road's flow. At most `max_workers`
+    requests run at a time over pooled keep-alive connections; timeouts,
+    connection errors, 429 and 5xx responses are retried `retries` times with
+    exponential backoff starting at `backoff` seconds.
+    """
+    if not api_key:
+        return [None] * len(points)
+    if proximity_dedupe_deg:
+        keys = [(math.floor(lat / proximity_dedupe_deg), math.floor(lon / proximity_dedupe_deg)) for lat, lon in points]
+    else:
+        keys = [(lat, lon) for lat, lon in points]
+    # The first point of each group is the one queried
+    unique = {}
+    for key, point in zip(keys, points):
+        unique.setdefault(key, point)
+
+    url = base_url.rstrip("/") + FLOW_PATH
+    workers = max(1, min(max_workers, len(unique)))
+    session = get_session(max_workers)
+    if workers == 1:
+        # Single lookups (and single-worker runs) need no thread pool
+        results = {key: _fetch_flow(session, url, api_key, lat, lon, timeout, retries, backoff)
+                   for key, (lat, lon) in unique.items()}
+        return [results[key] for key in keys]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {key: pool.submit(_fetch_flow, session, url, api_key, lat, lon, timeout, retries, backoff)
+                   for key, (lat, lon) in unique.items()}
+        results = {key: future.result() for key, future in futures.items()}
+    return [results[key] for key in keys]
+
+def fetch_real_time_traffic(api_key, lat, lon, base_url=TOMTOM_BASE_URL, timeout=5, retries=0):
     """
     Fetches real-time traffic flow data from TomTom API.
     Returns a dictionary with speed and congestion info.
+    Interactive callers poll this, so a failed lookup is not retried by
+    default and costs at most `timeout` seconds.
     """
     if not api_key:
         return None
         
     # TomTom Traffic Flow API endpoint
     # https://developer.tomtom.com/traffic-api/documentation/traffic-flow/flow-segment-data
-    base_url = "https://api.tomtom.com/traffic/services/4/flowSegmentData/absolute/10/json"
-    
+    return fetch_traffic_batch(api_key, [(lat, lon)], timeout=timeout, retries=retries, base_url=base_url)[0]
+
+# TomTom limits incident bboxes to 10,000 km2; zoom 9 tiles are at most ~78 km across
+INCIDENT_MIN_ZOOM = 9
+INCIDENT_MAX_ZOOM = 16
+
+def lat_lon_to_tile(lat, lon, zoom):
+    """
+    Web Mercator (x, y) tile containing a point at `zoom`.
+    """
+    n = 2 ** zoom
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bbox(x, y, zoom):
+    """
+    (min_lon, min_lat, max_lon, max_lat) of a tile.
+    """
+    n = 2 ** zoom
+    def lat_at(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+    return x / n * 360.0 - 180.0, lat_at(y + 1), (x + 1) / n * 360.0 - 180.0, lat_at(y)
+
+def quadkey(x, y, zoom):
+    """
+    Bing-style quadkey string naming a tile; one digit per zoom level.
+    """
+    digits = []
+    for z in range(zoom, 0, -1):
+        mask = 1 << (z - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+def zoom_for_radius(lat, radius, min_zoom=INCIDENT_MIN_ZOOM, max_zoom=INCIDENT_MAX_ZOOM):
+    """
+    Deepest zoom whose tiles are at least 2 * `radius` metres wide at `lat`,
+    so a query of that radius touches at most 2 x 2 tiles. Radii under a
+    metre (including 0) get `max_zoom`.
+    """
+    width = EARTH_CIRCUMFERENCE_M * max(math.cos(math.radians(lat)), 1e-6) / (2 * max(radius, 1.0))
+    zoom = int(math.floor(math.log2(width)))
+    return min(max(zoom, min_zoom), max_zoom)
+
+INCIDENT_PATH = "/traffic/services/5/incidentDetails"
+INCIDENT_FIELDS = "{incidents{type,geometry{type,coordinates},properties{id,iconCategory,magnitudeOfDelay,events{description},startTime,endTime}}}"
+# Incidents per map tile, keyed by quadkey
+incident_cache = TTLCache(ttl=120.0, max_size=4096)
+
+def _parse_incidents(data):
+    incidents = []
+    for item in data.get("incidents", []):
+        props = item.get("properties", {})
+        coords = item.get("geometry", {}).get("coordinates", [])
+        if not coords:
+            continue
+        # Points have one coordinate pair, lines a list of them; use the first as the location
+        points = [coords] if isinstance(coords[0], (int, float)) else coords
+        first = points[0]
+        lons = [p[0] for p in points]
+        lats = [p[1] for p in points]
+
+        # Extract description
+        desc = "Traffic Incident"
+        if "events" in props and props["events"]:
+            desc = props["events"][0].get("description", desc)
+
+        incidents.append({
+            "id": props.get("id"),
+            "type": props.get("iconCategory", "Unknown"),
+            "severity": "High" if props.get("magnitudeOfDelay", 0) > 2 else "Moderate",
+            "description": desc,
+            "lat": first[1],
+            "lon": first[0],
+            # (min_lon, min_lat, max_lon, max_lat) of the whole geometry
+            "bbox": (min(lons), min(lats), max(lons), max(lats))
+        })
+    return incidents
+
+def _fetch_tile(session, url, api_key, x, y, zoom, timeout):
+    min_lon, min_lat, max_lon, max_lat = tile_bbox(x, y, zoom)
     params = {
         "key": api_key,
-        "point": f"{lat},{lon}"
+        "bbox": f"{min_lon:.6f},{min_lat:.6f},{max_lon:.6f},{max_lat:.6f}",
+        "fields": INCIDENT_FIELDS
     }
-    
-    try:
-        response = requests.get(base_url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        flow_data = data.get("flowSegmentData", {})
-        
-        # Extract relevant metrics
-        current_speed = flow_data.get("currentSpeed", 0) # km/h
-        free_flow_speed = flow_data.get("freeFlowSpeed", 0) # km/h
-        confidence = flow_data.get("confidence", 0)
-        
-        # Calculate congestion level (0 to 100%)
-        # If current speed is near free flow, congestion is low.
-        if free_flow_speed > 0:
-            congestion = max(0, min(100, (1 - (current_speed / free_flow_speed)) * 100))
-        else:
-            congestion = 0
-            
-        return {
-            "current_speed": int(current_speed),
-            "free_flow_speed": int(free_flow_speed),
-            "congestion_level": int(congestion),
-            "confidence": confidence
-        }
-        
-    except Exception as e:
-        print(f"TomTom API Error: {e}")
-        return None
+    # Incident Details endpoint needs specific structure
+    # https://developer.tomtom.com/traffic-api/documentation/traffic-incidents/incident-details
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return _parse_incidents(response.json())
 
-def fetch_real_time_incidents(api_key, lat, lon, radius=5000):
+def fetch_real_time_incidents(api_key, lat, lon, radius=5000, zoom=None, cache=incident_cache,
+                              base_url=TOMTOM_BASE_URL, timeout=5):
     """
     Fetches traffic incidents from TomTom API within a radius (meters).
+
+    The area is covered by fixed Web Mercator tiles; tiles already in `cache`
+    are reused and only the rest are fetched (concurrently), so nearby or
+    overlapping queries cost few or no requests. Incidents that span several
+    tiles are merged, and results are limited to incidents whose geometry
+    overlaps the radius's bounding box (a long closure that starts outside
+    the area but runs through it is kept).
+    Returns None if any tile could not be fetched.
+
+    By default the zoom comes from `zoom_for_radius`, so a cold query costs
+    1-4 requests where a single bbox request would cost one; each tile
+    request covers up to ~4x the queried area in exchange for reuse.
     """
     if not api_key:
         return []
-        
-    # Construct bounding box from radius (approximate)
-    # 1 deg lat ~ 111km, 1 deg lon ~ 111km * cos(lat)
-    lat_delta = radius / 111000
-    lon_delta = radius / (111000 * abs(requests.utils.quote(str(lat)) and 1)) # Simplified
-    
-    # Better bbox calculation
-    min_lat = lat - 0.05 # approx 5km
-    max_lat = lat + 0.05
-    min_lon = lon - 0.05
-    max_lon = lon + 0.05
-    
-    base_url = "https://api.tomtom.com/traffic/services/5/incidentDetails"
-    
-    params = {
-        "key": api_key,
-        "bbox": f"{min_lon},{min_lat},{max_lon},{max_lat}",
-        "fields": "{incidents{type,geometry{type,coordinates},properties{iconCategory,magnitudeOfDelay,events{description},startTime,endTime}}}"
-    }
-    
-    try:
-        # Incident Details endpoint needs specific structure
-        # https://developer.tomtom.com/traffic-api/documentation/traffic-incidents/incident-details
-        url = f"{base_url}?key={api_key}&bbox={min_lon},{min_lat},{max_lon},{max_lat}&fields={{incidents{{type,geometry{{type,coordinates}},properties{{iconCategory,magnitudeOfDelay,events{{description}},startTime,endTime}}}}}}"
-        
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        incidents = []
-        for item in data.get("incidents", []):
-            props = item.get("properties", {})
-            coords = item.get("geometry", {}).get("coordinates", [])
-            
-            # Extract description
-            desc = "Traffic Incident"
-            if "events" in props and props["events"]:
-                desc = props["events"][0].get("description", desc)
-                
-            incidents.append({
-                "type": props.get("iconCategory", "Unknown"),
-                "severity": "High" if props.get("magnitudeOfDelay", 0) > 2 else "Moderate",
-                "description": desc,
-                "lat": coords[0][1] if coords else lat, # Simple centroid
-                "lon": coords[0][0] if coords else lon
-            })
-            
-        return incidents
-
-    except Exception as e:
-        print(f"TomTom Incident API Error: {e}")
-        return None
+    if zoom is None:
+        zoom = zoom_for_radius(lat, radius)
+
+    min_lon, min_lat, max_lon, max_lat = bbox_for_radius(lat, lon, radius)
+    x0, y0 = lat_lon_to_tile(max_lat, min_lon, zoom)
+    x1, y1 = lat_lon_to_tile(min_lat, max_lon, zoom)
+    tiles = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    found = {}
+    missing = []
+    for x, y in tiles:
+        cached = cache.get(quadkey(x, y, zoom)) if cache is not None else None
+        if cached is None:
+            missing.append((x, y))
+        else:
+            found[(x, y)] = cached
+
+    if missing:
+        url = base_url.rstrip("/") + INCIDENT_PATH
+        session = get_session()
+        with ThreadPoolExecutor(max_workers=min(len(missing), 8)) as pool:
+            futures = {tile: pool.submit(_fetch_tile, session, url, api_key, *tile, zoom, timeout) for tile in missing}
+            failed = False
+            for tile, future in futures.items():
+                try:
+                    found[tile] = future.result()
+                except Exception as e:
+                    print(f"TomTom Incident API Error: {e}")
+                    failed = True
+                    continue
+                if cache is not None:
+                    cache.put(quadkey(*tile, zoom), found[tile])
+        if failed:
+            return None
+
+    incidents, seen = [], set()
+    for tile in tiles:
+        for inc in found[tile]:
+            key = inc["id"] or (inc["type"], round(inc["lat"], 6), round(inc["lon"], 6), inc["description"])
+            if key in seen:
+                continue
+            seen.add(key)
+            inc_min_lon, inc_min_lat, inc_max_lon, inc_max_lat = inc["bbox"]
+            if inc_min_lat <= max_lat and inc_max_lat >= min_lat and inc_min_lon <= max_lon and inc_max_lon >= min_lon:
+                incidents.append(inc)
+    return incidents
 
 if __name__ == "__main__":
     # Test with a dummy key (will fail, but checks import)
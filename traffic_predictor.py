@@ -1,47 +1,367 @@
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error
 import joblib
+import json
 import os
+import copy
+import shutil
+import threading
+import time
+from collections import deque
+from numpy.lib import recfunctions as rfn
+from concurrent.futures import ProcessPoolExecutor
+from compiled_forest import CompiledForest, prune_forest
+from feature_pipeline import FeaturePipeline
+from prediction_cache import PredictionCache
+from lookup_table import build_lookup_table, quantile_axis, uniform_axis
+from traffic_store import FEATURE_DTYPES, TARGET, available_columns, read_traffic_data
+
+# Discrete feature domains used when distilling the model into a lookup table
+DISCRETE_DOMAINS = {
+    "hour": range(24),
+    "day_of_week": range(7),
+    "weather": range(1, 5),
+    "event": range(2),
+}
+
+# Up to this many rows the compiled forest beats sklearn's per-call overhead
+COMPILED_MAX_ROWS = 1000
+
+# Model families TrafficPredictor can train; all share the train/predict/save/load surface
+BACKENDS = {
+    "forest": lambda: RandomForestRegressor(n_estimators=50, random_state=42),
+    "forest_parallel": lambda: RandomForestRegressor(n_estimators=50, n_jobs=-1, random_state=42),
+    "hist_gbm": lambda: HistGradientBoostingRegressor(max_iter=300, learning_rate=0.1, random_state=42),
+}
+
+def make_model(backend, **params):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', choose from {sorted(BACKENDS)}")
+    return BACKENDS[backend]().set_params(**params)
+
+# Models loaded in this process, keyed by artifact identity, so each artifact
+# is read at most once per process however many predictors point at it
+_loaded_artifacts = {}
+_artifacts_lock = threading.Lock()
+
+def _artifact_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+def _load_artifact(path, loader):
+    key = _artifact_key(path)
+    with _artifacts_lock:
+        if key not in _loaded_artifacts:
+            # Only the current version of each file stays registered, so a retrained
+            # model's predecessors are freed once no predictor uses them
+            for old in [k for k in _loaded_artifacts if k[0] == key[0]]:
+                del _loaded_artifacts[old]
+            _loaded_artifacts[key] = loader(path)
+        return _loaded_artifacts[key]
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def compiled_path_for(model_path):
+    return os.path.splitext(model_path)[0] + ".forest"
+
+def metadata_path_for(model_path):
+    return os.path.splitext(model_path)[0] + ".json"
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def as_feature_matrix(X, features):
+    """
+    Returns `X` as a 2-D float32 array with columns in `features` order.
+
+    A C-contiguous float32 matrix is returned as-is. Structured arrays are
+    viewed rather than copied when their fields are already float32 and in
+    order, and Arrow tables/record batches (anything with `column_names` and
+    `column()`) are gathered column by column without going through pandas.
+    """
+    if isinstance(X, pd.DataFrame):
+        return X[features].to_numpy(dtype=np.float32)
+    if hasattr(X, "column_names") and hasattr(X, "column"):
+        missing = [f for f in features if f not in X.column_names]
+        if missing:
+            raise ValueError(f"Missing features: {missing}")
+        out = np.empty((X.num_rows, len(features)), dtype=np.float32)
+        for j, f in enumerate(features):
+            out[:, j] = np.asarray(X.column(f))
+        return out
+    X = np.asarray(X)
+    if X.dtype.names is not None:
+        missing = [f for f in features if f not in X.dtype.names]
+        if missing:
+            raise ValueError(f"Missing features: {missing}")
+        return rfn.structured_to_unstructured(X[features], dtype=np.float32)
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.shape[1] != len(features):
+        raise ValueError(f"X has {X.shape[1]} columns, expected {len(features)} ({', '.join(features)})")
+    return X
 
 class TrafficPredictor:
-    def __init__(self, model_path="traffic_model.pkl"):
+    def __init__(self, model_path="traffic_model.pkl", lazy=True, backend=None, model_params=None):
         self.model_path = model_path
-        self.model = RandomForestRegressor(n_estimators=50, random_state=42)
+        # backend=None follows the saved artifact (or "forest"); an explicit choice is kept for training
+        self.backend = backend or "forest"
+        self._backend_explicit = backend is not None
+        # Extra estimator parameters, e.g. {"max_depth": 16, "max_leaf_nodes": 2000} to cap tree size
+        self.model_params = model_params or {}
+        self._model = make_model(self.backend, **self.model_params)
+        # Fit time, predict latency, artifact size and MAE of the last training run
+        self.metrics = {}
+        # Incremented on every save; incremental artifacts also record their parent
+        self.version = 0
+        self.parent_version = None
+        # Artifact to load on first use when lazy
+        self._pending_path = None
         self.is_trained = False
+        self.compiled = None
+        self.use_compiled = False
+        # Pruning limits set by compact(); re-applied whenever the model changes
+        self.compaction = None
+        self.cache = None
+        # Per-thread (1, n_features) input row reused by predict_row
+        self._row_buffers = threading.local()
         self.features = ["hour", "day_of_week", "weather", "lat", "lon", "event", "wind", "precip", "visibility", "pollution"]
+        # Builds feature rows from raw inputs; fitted in train() and saved with the model
+        self.pipeline = FeaturePipeline(self.features)
         
         if os.path.exists(self.model_path):
             try:
-                self.load(self.model_path)
+                self.load(self.model_path, lazy=lazy)
             except Exception as e:
                 print(f"Could not load existing model: {e}")
 
-    def load_data(self, filepath):
+    def _load_pending(self):
+        path = self._pending_path
+        try:
+            self._model = _load_artifact(path, joblib.load)
+        except Exception:
+            # An unreadable artifact means no model, as it would have on an eager load
+            self._pending_path = None
+            self.is_trained = False
+            self.compiled = None
+            raise
+        self._pending_path = None
+        print(f"Model loaded from {path}")
+
+    @property
+    def model(self):
+        if self._pending_path is not None:
+            self._load_pending()
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self._pending_path = None
+
+    def _read_columns(self, filepath, chunksize=None):
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Data file not found: {filepath}")
-        df = pd.read_csv(filepath)
-        # Ensure all required features exist
-        missing_features = [f for f in self.features if f not in df.columns]
-        if missing_features:
-            raise ValueError(f"Missing features in data: {missing_features}")
-            
-        X = df[self.features]
-        y = df["traffic_volume"]
+        return read_traffic_data(filepath, columns=self.features + [TARGET], chunksize=chunksize)
+
+    def load_data(self, filepath, weather=None, incidents=None):
+        """
+        Reads only the feature and target columns, using compact dtypes.
+        `filepath` may be a CSV file or a traffic_store directory.
+        Features missing from the data (or given as `weather`/`incidents`)
+        are filled in by the feature pipeline, as they would be when serving.
+        """
+        columns = available_columns(filepath)
+        if TARGET not in columns:
+            raise ValueError(f"Missing target column in data: {TARGET}")
+        if all(f in columns for f in self.features) and weather is None and incidents is None:
+            df = self._read_columns(filepath)
+            return df[self.features], df[TARGET]
+
+        raw = [c for c in self.features + ["timestamp"] if c in columns]
+        df = read_traffic_data(filepath, columns=raw + [TARGET])
+        X = pd.DataFrame(self.pipeline.transform(df, weather=weather, incidents=incidents), columns=self.features)
+        return X.astype(FEATURE_DTYPES), df[TARGET]
+
+    def load_matrix(self, filepath, cache_dir=None, chunksize=500_000):
+        """
+        Returns (X, y) as a C-contiguous float32 matrix in `self.features`
+        order and a float32 target vector.
+        With `cache_dir`, the matrix is written once as raw float32 files and
+        memory-mapped read-only on later calls, so repeat runs skip CSV parsing
+        and worker processes share the same pages.
+        """
+        if cache_dir is None:
+            df = self._read_columns(filepath)
+            X = np.ascontiguousarray(df[self.features].to_numpy(dtype=np.float32))
+            return X, df[TARGET].to_numpy(dtype=np.float32)
+
+        meta_path = os.path.join(cache_dir, "meta.json")
+        # A store changes whenever its manifest is rewritten
+        source = os.stat(os.path.join(filepath, "manifest.json") if os.path.isdir(filepath) else filepath)
+        source_key = {"path": os.path.abspath(filepath), "size": source.st_size, "mtime": source.st_mtime}
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if meta is None or meta.get("source") != source_key or meta.get("features") != self.features \
+                or _path_size(os.path.join(cache_dir, "features.f32")) != meta["rows"] * len(self.features) * 4:
+            meta = self._build_matrix_cache(filepath, cache_dir, chunksize, source_key)
+
+        n_rows = meta["rows"]
+        X = np.memmap(os.path.join(cache_dir, "features.f32"), dtype=np.float32, mode="r",
+                      shape=(n_rows, len(self.features))) if n_rows else np.empty((0, len(self.features)), np.float32)
+        y = np.memmap(os.path.join(cache_dir, "target.f32"), dtype=np.float32, mode="r",
+                      shape=(n_rows,)) if n_rows else np.empty(0, np.float32)
         return X, y
 
+    def _build_matrix_cache(self, filepath, cache_dir, chunksize, source_key):
+        print(f"Building feature matrix cache in {cache_dir}...")
+        os.makedirs(cache_dir, exist_ok=True)
+        # Per-process temporary files, swapped in with os.replace: other processes
+        # may have the current files mapped, and two may be building at once
+        suffix = f".{os.getpid()}.tmp"
+        paths = {name: os.path.join(cache_dir, name) for name in ("features.f32", "target.f32", "meta.json")}
+        n_rows = 0
+        with open(paths["features.f32"] + suffix, "wb") as fx, open(paths["target.f32"] + suffix, "wb") as fy:
+            for chunk in self._read_columns(filepath, chunksize=chunksize):
+                fx.write(np.ascontiguousarray(chunk[self.features].to_numpy(dtype=np.float32)).tobytes())
+                fy.write(chunk[TARGET].to_numpy(dtype=np.float32).tobytes())
+                n_rows += len(chunk)
+        meta = {"source": source_key, "features": self.features, "rows": n_rows}
+        with open(paths["meta.json"] + suffix, "w") as f:
+            json.dump(meta, f)
+        # meta.json is replaced last so it never describes files that are not in place yet
+        for name in ("features.f32", "target.f32", "meta.json"):
+            os.replace(paths[name] + suffix, paths[name])
+        return meta
+
     def train(self, X, y):
-        print("Training model...")
+        print(f"Training model ({self.backend})...")
+        # Refit from scratch; a lazily pending artifact is about to be replaced
+        self.model = make_model(self.backend, **self.model_params)
         X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+        start = time.perf_counter()
         self.model.fit(X_train, y_train)
+        fit_time = time.perf_counter() - start
+        self.pipeline.fit(X_train if isinstance(X_train, pd.DataFrame) else pd.DataFrame(X_train, columns=self.features))
+        self.is_trained = True
+        # Before validating, so a compacted predictor is measured as it will serve
+        self._model_changed()
+
+        start = time.perf_counter()
         preds = self.model.predict(X_val)
+        batch_time = time.perf_counter() - start
         mae = mean_absolute_error(y_val, preds)
-        self.is_trained = True
+
+        row = X_val[:1]
+        single_times = []
+        for _ in range(20):
+            start = time.perf_counter()
+            self._predict_features(row)
+            single_times.append(time.perf_counter() - start)
+
+        self.metrics = {
+            "backend": self.backend,
+            "mae": float(mae),
+            "fit_time_s": fit_time,
+            "train_rows": len(X_train),
+            "predict_single_ms": float(np.median(single_times) * 1000),
+            "predict_batch_us_per_row": batch_time / max(len(X_val), 1) * 1e6,
+        }
         print(f"Model Validation MAE: {mae:.2f}")
+        self.parent_version = None
+        self.save()
+        print(f"Fit time: {fit_time:.2f}s | Single-row predict: {self.metrics['predict_single_ms']:.3f} ms | "
+              f"Batch predict: {self.metrics['predict_batch_us_per_row']:.2f} us/row | "
+              f"Artifact size: {self.metrics['artifact_bytes'] / 1e6:.1f} MB")
+        return mae
+
+    def train_incremental(self, X_new, y_new, n_new_estimators=10, max_estimators=100):
+        """
+        Adds `n_new_estimators` trees fitted only on the new slice to the
+        existing forest and retires the oldest trees beyond `max_estimators`,
+        so the cost follows the size of the new data, not the whole history.
+        Validation uses a held-out part of the new slice only. The result is
+        saved as the next version, with a snapshot at <model>.v<version>.pkl.
+        """
+        if not self.is_trained:
+            raise Exception("Model is not trained yet. Please train the model first.")
+        previous = self.model
+        if not isinstance(previous, RandomForestRegressor):
+            raise ValueError(f"Incremental training needs a forest backend, not {type(previous).__name__}")
+        print(f"Training {n_new_estimators} new trees on {len(X_new)} rows...")
+        X_train, X_val, y_train, y_val = train_test_split(X_new, y_new, test_size=0.2, random_state=42)
+
+        start = time.perf_counter()
+        # Same hyperparameters as the existing trees (plus any model_params given now);
+        # a fresh seed per version keeps new trees different from earlier ones
+        update = clone(previous).set_params(**self.model_params)
+        update.set_params(n_estimators=n_new_estimators, random_state=42 + self.version + 1)
+        update.fit(X_train, y_train)
+        fit_time = time.perf_counter() - start
+
+        estimators = list(previous.estimators_) + list(update.estimators_)
+        retired = max(0, len(estimators) - max_estimators)
+        # Shallow copy: the kept trees are shared with the previous model, not duplicated
+        model = copy.copy(previous)
+        model.estimators_ = estimators[retired:]
+        model.n_estimators = len(model.estimators_)
+
+        previous_mae = mean_absolute_error(y_val, previous.predict(X_val))
+        self.model = model
+        self._model_changed()
+        model = self.model
+        mae = mean_absolute_error(y_val, model.predict(X_val))
+
+        self.metrics = {
+            "backend": self.backend,
+            "mae": float(mae),
+            "previous_mae": float(previous_mae),
+            "fit_time_s": fit_time,
+            "train_rows": len(X_train),
+            "incremental": {"added": n_new_estimators, "retired": retired, "estimators": model.n_estimators},
+        }
+        print(f"New-slice MAE: {mae:.2f} (previous model: {previous_mae:.2f}) | "
+              f"{model.n_estimators} trees, {retired} retired | Fit time: {fit_time:.2f}s")
+        self.parent_version = self.version
         self.save()
+        self._snapshot()
         return mae
 
+    def _snapshot(self):
+        root, ext = os.path.splitext(self.model_path)
+        snapshot = f"{root}.v{self.version}{ext}"
+        # save() replaces the main files rather than rewriting them, so hard links stay intact
+        _link_or_copy(self.model_path, snapshot)
+        _link_or_copy(metadata_path_for(self.model_path), metadata_path_for(snapshot))
+        forest_path = compiled_path_for(self.model_path)
+        snapshot_forest = compiled_path_for(snapshot)
+        shutil.rmtree(snapshot_forest, ignore_errors=True)
+        if os.path.isdir(forest_path):
+            shutil.copytree(forest_path, snapshot_forest, copy_function=_link_or_copy)
+            # Tie the arrays to the snapshot file so loading the snapshot maps them too
+            meta = CompiledForest.read_meta(snapshot_forest)
+            meta["source"] = list(_artifact_key(snapshot))
+            meta_path = os.path.join(snapshot_forest, "meta.json")
+            os.remove(meta_path)
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+        print(f"Version {self.version} snapshot saved to {snapshot}")
+
     def predict(self, X):
         if not self.is_trained:
             raise Exception("Model is not trained yet. Please train the model first.")
@@ -54,26 +374,393 @@ class TrafficPredictor:
                 # For now, let's error to be safe, or just select the ones we need if extra are present.
                 pass 
             X = X[self.features]
-            
+
+        if self.cache is not None:
+            return self.cache.predict(self._predict_features, X)
+        return self._predict_features(X)
+
+    def predict_array(self, X):
+        """
+        Like `predict`, but for callers that already hold the inputs as an
+        array: a float32 matrix in `self.features` order is used without a
+        copy or DataFrame (see `as_feature_matrix` for the other accepted
+        inputs).
+        """
+        if not self.is_trained:
+            raise Exception("Model is not trained yet. Please train the model first.")
+        X = as_feature_matrix(X, self.features)
+        if self.cache is not None:
+            return self.cache.predict(self._predict_features, X)
+        return self._predict_features(X)
+
+    def predict_request(self, lat, lon, when=None, weather=None, incidents=None, **values):
+        """
+        Predicts one location from raw request inputs (a datetime, a weather
+        dict as returned by fetch_current_weather, a list of incidents),
+        assembled by the saved feature pipeline into `row_buffer()`.
+        """
+        buf = self.pipeline.transform_one(lat, lon, when=when, weather=weather, incidents=incidents,
+                                          out=self.row_buffer(), **values)
+        return float(self.predict_array(buf)[0])
+
+    def row_buffer(self):
+        """
+        This thread's reusable (1, n_features) float32 input row.
+        """
+        buf = getattr(self._row_buffers, "row", None)
+        if buf is None or buf.shape[1] != len(self.features):
+            buf = self._row_buffers.row = np.zeros((1, len(self.features)), dtype=np.float32)
+        return buf
+
+    def predict_row(self, row=None, **values):
+        """
+        Predicts a single row and returns a float. Pass `row` as a sequence in
+        `self.features` order or the feature values as keywords; either way
+        they are written into the preallocated `row_buffer()`.
+        """
+        buf = self.row_buffer()
+        if row is not None:
+            buf[0] = row
+        else:
+            missing = [f for f in self.features if f not in values]
+            if missing:
+                raise ValueError(f"Missing features: {missing}")
+            for i, f in enumerate(self.features):
+                buf[0, i] = values[f]
+        return float(self.predict_array(buf)[0])
+
+    def _predict_features(self, X):
+        # sklearn is faster on large batches, but only once its model is in memory: until
+        # then the compiled arrays (memory-mapped, so shared between processes) serve everything
+        if self.compiled is not None and (not self.compiled.exact or len(X) <= COMPILED_MAX_ROWS
+                                          or self._pending_path is not None):
+            return self.compiled.predict(X.to_numpy(dtype=np.float32) if isinstance(X, pd.DataFrame) else X)
+        if not isinstance(X, pd.DataFrame) and hasattr(self.model, "feature_names_in_"):
+            X = pd.DataFrame(X, columns=self.features)
         return self.model.predict(X)
 
+    def enable_cache(self, max_size=10000, ttl=300.0, coord_decimals=3, weather_decimals=0):
+        """
+        Caches predictions keyed on the input rounded to `coord_decimals` for
+        lat/lon and `weather_decimals` for wind, precip, visibility and
+        pollution (discrete features are used as-is). The cache is dropped
+        whenever train/load replaces the model.
+        """
+        decimals = {"lat": coord_decimals, "lon": coord_decimals}
+        decimals.update({f: weather_decimals for f in ("wind", "precip", "visibility", "pollution")})
+        self.cache = PredictionCache(self.features, max_size=max_size, ttl=ttl, decimals=decimals)
+        return self.cache
+
+    def compile(self):
+        """
+        Exports the trained forest into flat NumPy arrays for low-latency
+        single-row and small-batch prediction. Results are identical to the
+        sklearn model. The export is redone automatically after train/load.
+        If the saved artifact has up-to-date compiled arrays they are
+        memory-mapped instead, without loading the sklearn model at all; the
+        pages are then shared by every process serving the same artifact, and
+        the mapped arrays serve batches of any size until something else
+        needs the sklearn model.
+        Returns None for backends that are not forests.
+        """
+        if not self.is_trained:
+            raise Exception("Model is not trained yet. Please train the model first.")
+        self.use_compiled = True
+        forest_path = compiled_path_for(self.model_path)
+        meta = CompiledForest.read_meta(forest_path)
+        if (self._pending_path is not None and meta is not None
+                and meta.get("source") == list(_artifact_key(self._pending_path))):
+            try:
+                self.compiled = _load_artifact(forest_path, CompiledForest.load)
+                return self.compiled
+            except Exception as e:
+                print(f"Could not map compiled forest, exporting it from the model: {e}")
+        model = self.model
+        try:
+            if self.compaction is not None:
+                # The pruned trees are the model of record, served from narrow arrays
+                self.model = model = prune_forest(model, **self.compaction)
+                self.compiled = CompiledForest.from_sklearn(model).compact()
+            else:
+                self.compiled = CompiledForest.from_sklearn(model)
+        except ValueError as e:
+            print(f"Compiled forest not available: {e}")
+            self.compiled = None
+        return self.compiled
+
+    def artifact_id(self):
+        """
+        Identity of the saved model file (path, size, mtime), or None if there
+        is none; it changes whenever the model is saved again.
+        """
+        if not os.path.exists(self.model_path):
+            return None
+        return list(_artifact_key(self.model_path))
+
+    def export_lookup_table(self, X_ref, grid_size=5, weather_bins=3, path=None, error_sample=20000):
+        """
+        Distills the model into a dense LookupTable for O(1) predictions
+        without sklearn. Discrete features use their full domain; lat/lon use
+        a `grid_size` x `grid_size` grid over the range of `X_ref`, and the
+        continuous weather features use `weather_bins` equal-frequency bins.
+        The error against the full model on a sample of `X_ref` is stored in
+        `table.error`, and `table.source` records which saved model it came
+        from, so stale tables can be detected after a retrain.
+        """
+        if not self.is_trained:
+            raise Exception("Model is not trained yet. Please train the model first.")
+        X_ref = X_ref[self.features] if isinstance(X_ref, pd.DataFrame) else pd.DataFrame(X_ref, columns=self.features)
+        axes = []
+        for f in self.features:
+            if f in DISCRETE_DOMAINS:
+                axes.append(np.array(DISCRETE_DOMAINS[f], dtype=np.float64))
+            elif f in ("lat", "lon"):
+                axes.append(uniform_axis(X_ref[f], grid_size))
+            else:
+                axes.append(quantile_axis(X_ref[f], weather_bins))
+
+        table = build_lookup_table(self._predict_features, self.features, axes)
+        table.source = self.artifact_id()
+
+        sample = X_ref.sample(min(error_sample, len(X_ref)), random_state=42).to_numpy(dtype=np.float32)
+        model_preds = self._predict_features(sample)
+        table_preds = table.predict(sample)
+        table.error = {
+            "mae": float(np.mean(np.abs(table_preds - model_preds))),
+            "max_abs_error": float(np.max(np.abs(table_preds - model_preds))),
+            "rows": len(sample),
+        }
+        print(f"Lookup table {table.shape}: {table.values.nbytes / 1e6:.1f} MB, "
+              f"MAE vs model {table.error['mae']:.2f}")
+        if path:
+            table.save(path)
+            print(f"Lookup table saved to {path}")
+        return table
+
+    def compact(self, max_depth=None, max_leaf_nodes=None, X_val=None, y_val=None):
+        """
+        Prunes the forest to `max_depth` / `max_leaf_nodes` and compiles it
+        with float32 thresholds and values and narrow index types. The
+        compacted arrays then serve all predictions, the pruned sklearn trees
+        replace the model (so `save` writes a correspondingly small artifact),
+        and the same limits are applied again after train/train_incremental.
+        Returns a report of size and, when validation data is given,
+        accuracy before and after.
+        """
+        model = self.model
+        try:
+            full = self.compiled if self.compiled is not None and self.compiled.exact else \
+                CompiledForest.from_sklearn(model)
+        except ValueError:
+            raise ValueError(f"Compaction needs a forest backend, not {self.backend}")
+        self.compaction = {"max_depth": max_depth, "max_leaf_nodes": max_leaf_nodes}
+        compacted = self.compile()
+
+        report = {
+            "nodes_before": full.n_nodes,
+            "nodes_after": compacted.n_nodes,
+            "bytes_before": full.nbytes,
+            "bytes_after": compacted.nbytes,
+            "max_depth_after": compacted.max_depth,
+        }
+        if X_val is not None:
+            X_val = X_val[self.features] if isinstance(X_val, pd.DataFrame) else X_val
+            X_val = np.asarray(X_val, dtype=np.float32)
+            full_preds = full.predict(X_val)
+            compact_preds = compacted.predict(X_val)
+            report["mae_vs_full_model"] = float(np.mean(np.abs(compact_preds - full_preds)))
+            if y_val is not None:
+                y_val = np.asarray(y_val, dtype=np.float64)
+                report["mae_before"] = float(mean_absolute_error(y_val, full_preds))
+                report["mae_after"] = float(mean_absolute_error(y_val, compact_preds))
+
+        if self.cache is not None:
+            self.cache.clear()
+        self.metrics["compaction"] = report
+        print(f"Compacted forest: {report['nodes_before']} -> {report['nodes_after']} nodes, "
+              f"{report['bytes_before'] / 1e6:.1f} -> {report['bytes_after'] / 1e6:.1f} MB"
+              + (f", MAE {report['mae_before']:.2f} -> {report['mae_after']:.2f}" if "mae_after" in report else ""))
+        return report
+
+    def _model_changed(self):
+        # Anything derived from the previous model is stale now
+        self.compiled = None
+        if self.cache is not None:
+            self.cache.clear()
+        if self.use_compiled or self.compaction is not None:
+            self.compile()
+
     def save(self):
-        joblib.dump(self.model, self.model_path, compress=3)
+        """
+        Writes the model (compressed; sklearn trees are copied into private
+        memory on load either way), plus the compiled forest arrays when the
+        model is a forest, which are what processes map and share, and a
+        small JSON file with the backend and training metrics.
+        """
+        tmp_path = f"{self.model_path}.tmp"
+        joblib.dump(self.model, tmp_path, compress=3)
+        # Replace rather than rewrite, so readers never see a partial file
+        os.replace(tmp_path, self.model_path)
+        forest_path = compiled_path_for(self.model_path)
+        try:
+            forest = self.compiled if self.compiled is not None else CompiledForest.from_sklearn(self.model)
+        except ValueError:
+            forest = None
+        if forest is not None:
+            forest.save(forest_path, source=list(_artifact_key(self.model_path)))
+        else:
+            shutil.rmtree(forest_path, ignore_errors=True)
+
+        self.metrics["artifact_bytes"] = _path_size(self.model_path) + _path_size(forest_path)
+        self.version += 1
+        meta_path = metadata_path_for(self.model_path)
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump({"backend": self.backend, "version": self.version, "parent_version": self.parent_version,
+                       "metrics": self.metrics, "pipeline": self.pipeline.to_dict(), "compaction": self.compaction},
+                      f, indent=2)
+        # Replaced, not rewritten, so version snapshots linked to the old file keep their contents
+        os.replace(f"{meta_path}.tmp", meta_path)
         print(f"Model saved to {self.model_path}")
 
-    def load(self, path):
-        self.model = joblib.load(path)
+    def load(self, path, lazy=False):
+        """
+        Loads a saved model, at most once per process.
+        With `lazy`, reading is deferred until the model is first needed.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model file not found: {path}")
+        self.model_path = path
+        self._pending_path = path
         self.is_trained = True
-        print(f"Model loaded from {path}")
+        meta_path = metadata_path_for(path)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if not self._backend_explicit:
+                self.backend = meta.get("backend", self.backend)
+            self.metrics = meta.get("metrics", {})
+            self.version = meta.get("version", 0)
+            self.parent_version = meta.get("parent_version")
+            self.compaction = meta.get("compaction")
+            if "pipeline" in meta:
+                self.pipeline = FeaturePipeline.from_dict(meta["pipeline"])
+        forest_meta = CompiledForest.read_meta(compiled_path_for(path))
+        if forest_meta is not None and not forest_meta.get("exact", True):
+            # A compacted forest is the model of record, so always serve from it
+            self.use_compiled = True
+        if not lazy:
+            self._load_pending()
+        self._model_changed()
+
+# --- Batch scoring ---
+
+_worker_predictor = None
+
+def _init_scoring_worker(model_path):
+    # Runs once per worker process, so the model is loaded once per worker
+    global _worker_predictor
+    _worker_predictor = TrafficPredictor(model_path)
+    if not _worker_predictor.is_trained:
+        raise Exception(f"No trained model found at {model_path}")
+    # Workers predict from the shared memory-mapped forest rather than a private sklearn copy each
+    _worker_predictor.compile()
+
+def _score_chunk(chunk, output_column="predicted_volume"):
+    chunk = chunk.reset_index(drop=True)
+    chunk[output_column] = _worker_predictor.predict(chunk)
+    return chunk
+
+def score_file(input_path, output_path, model_path="traffic_model.pkl", chunksize=100_000,
+               workers=None, output_column="predicted_volume"):
+    """
+    Scores an input CSV (or traffic_store directory) of any size in chunks and
+    appends predictions to `output_path` as each chunk finishes. Chunks are
+    spread over a process pool, at most 2 per worker in flight, and written
+    in input order.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+    # Passthrough columns keep their original values; only the model input is cast to float32
+    chunks = read_traffic_data(input_path, chunksize=chunksize, compact=False)
+    workers = workers or os.cpu_count() or 1
+    tmp_path = f"{output_path}.tmp"
+    n_rows = 0
+
+    with open(tmp_path, "w", newline="") as f:
+        def write(chunk):
+            nonlocal n_rows
+            chunk.to_csv(f, index=False, header=(n_rows == 0))
+            n_rows += len(chunk)
+            print(f"Scored {n_rows} rows...")
+
+        if workers == 1:
+            _init_scoring_worker(model_path)
+            for chunk in chunks:
+                write(_score_chunk(chunk, output_column))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_scoring_worker,
+                                     initargs=(model_path,)) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(_score_chunk, chunk, output_column))
+                    if len(pending) >= 2 * workers:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+
+    os.replace(tmp_path, output_path)
+    print(f"Predictions for {n_rows} rows saved to {output_path}")
+    return n_rows
 
 if __name__ == "__main__":
-    tp = TrafficPredictor()
-    try:
-        data_file = "traffic_data_large.csv" if os.path.exists("traffic_data_large.csv") else "sample_data.csv"
-        print(f"Loading data from {data_file}...")
-        X, y = tp.load_data(data_file)
-        mae = tp.train(X, y)
-        print(f"Training complete. MAE: {mae:.2f}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
- 
+    import argparse
+    parser = argparse.ArgumentParser(description="Train the traffic model or batch-score a file.")
+    sub = parser.add_subparsers(dest="command")
+    score = sub.add_parser("score", help="Score a CSV or traffic_store directory in chunks")
+    score.add_argument("input")
+    score.add_argument("output")
+    score.add_argument("--model", default="traffic_model.pkl")
+    score.add_argument("--chunksize", type=int, default=100_000)
+    score.add_argument("--workers", type=int, default=None)
+    update = sub.add_parser("update", help="Add trees trained on a new slice of data to the saved forest")
+    update.add_argument("data")
+    update.add_argument("--new-estimators", type=int, default=10)
+    update.add_argument("--max-estimators", type=int, default=100)
+    compact = sub.add_parser("compact", help="Prune and narrow the saved forest")
+    compact.add_argument("--max-depth", type=int, default=None)
+    compact.add_argument("--max-leaf-nodes", type=int, default=None)
+    compact.add_argument("--data", default=None, help="Validation data for the accuracy report")
+    table = sub.add_parser("export-table", help="Distill the model into a lookup table")
+    table.add_argument("data", help="Reference data used for grid ranges and error reporting")
+    table.add_argument("output", nargs="?", default="traffic_lut.npz")
+    table.add_argument("--grid-size", type=int, default=5)
+    table.add_argument("--weather-bins", type=int, default=3)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="forest",
+                        help="Model family to train")
+    args = parser.parse_args()
+
+    if args.command == "score":
+        score_file(args.input, args.output, model_path=args.model, chunksize=args.chunksize, workers=args.workers)
+    elif args.command == "update":
+        tp = TrafficPredictor()
+        X, y = tp.load_data(args.data)
+        tp.train_incremental(X, y, n_new_estimators=args.new_estimators, max_estimators=args.max_estimators)
+    elif args.command == "compact":
+        tp = TrafficPredictor()
+        X_val, y_val = tp.load_data(args.data) if args.data else (None, None)
+        tp.compact(max_depth=args.max_depth, max_leaf_nodes=args.max_leaf_nodes, X_val=X_val, y_val=y_val)
+        tp.save()
+    elif args.command == "export-table":
+        tp = TrafficPredictor()
+        X, _ = tp.load_data(args.data)
+        tp.export_lookup_table(X, grid_size=args.grid_size, weather_bins=args.weather_bins, path=args.output)
+    else:
+        tp = TrafficPredictor(backend=args.backend)
+        try:
+            data_file = "traffic_data_large.csv" if os.path.exists("traffic_data_large.csv") else "sample_data.csv"
+            print(f"Loading data from {data_file}...")
+            X, y = tp.load_data(data_file)
+            mae = tp.train(X, y)
+            print(f"Training complete. MAE: {mae:.2f}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
@@ -0,0 +1,336 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
+
+from geo_utils import bbox_for_radius, haversine_m
+
+# Compact on-disk/in-memory types for the model features
+FEATURE_DTYPES = {
+    "hour": "int8",
+    "day_of_week": "int8",
+    "weather": "int8",
+    "lat": "float32",
+    "lon": "float32",
+    "event": "int8",
+    "wind": "float32",
+    "precip": "float32",
+    "visibility": "float32",
+    "pollution": "float32",
+}
+TARGET = "traffic_volume"
+TARGET_DTYPE = "float32"
+
+MANIFEST = "manifest.json"
+
+def _geocell(lat, lon, cell_deg):
+    return np.floor(lat / cell_deg).astype(np.int64), np.floor(lon / cell_deg).astype(np.int64)
+
+def _column_array(series):
+    dtype = FEATURE_DTYPES.get(series.name, TARGET_DTYPE if series.name == TARGET else None)
+    if dtype is not None:
+        return series.to_numpy(dtype=dtype)
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        # Fixed-width unicode keeps .npy files pickle-free and mmap-able
+        return series.to_numpy().astype(str)
+    return series.to_numpy()
+
+def _load_manifest(store_dir):
+    path = os.path.join(store_dir, MANIFEST)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Not a traffic store (missing {MANIFEST}): {store_dir}")
+    with open(path) as f:
+        return json.load(f)
+
+def is_store(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST))
+
+def _write_manifest(store_dir, manifest):
+    tmp_path = os.path.join(store_dir, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(store_dir, MANIFEST))
+
+def _write_part(store_dir, manifest, key, arrays):
+    dow, clat, clon = key
+    rel_path = os.path.join(f"day_of_week={dow}", f"cell={clat}_{clon}", f"part-{manifest['next_part']:06d}")
+    os.makedirs(os.path.join(store_dir, rel_path), exist_ok=True)
+    for col, array in arrays.items():
+        np.save(os.path.join(store_dir, rel_path, f"{col}.npy"), array)
+    manifest["next_part"] += 1
+    return {"path": rel_path, "day_of_week": int(dow), "cell": [int(clat), int(clon)],
+            "rows": len(next(iter(arrays.values())))}
+
+def _concat_pieces(pieces):
+    return {col: np.concatenate([p[col] for p in pieces]) for col in pieces[0]}
+
+def _merge_parts(store_dir, manifest, parts, part_rows):
+    """
+    Rewrites the parts of one partition as few parts of about `part_rows`
+    rows each. Returns (new part list, replaced parts).
+    """
+    merged, replaced, group, n = [], [], [], 0
+    def flush():
+        if len(group) == 1:
+            merged.append(group[0])
+        elif group:
+            pieces = [{col: np.load(os.path.join(store_dir, p["path"], f"{col}.npy")) for col in manifest["columns"]}
+                      for p in group]
+            key = (group[0]["day_of_week"], *group[0]["cell"])
+            merged.append(_write_part(store_dir, manifest, key, _concat_pieces(pieces)))
+            replaced.extend(group)
+    for part in sorted(parts, key=lambda p: p["path"]):
+        if n and n + part["rows"] > part_rows:
+            flush()
+            group, n = [], 0
+        group.append(part)
+        n += part["rows"]
+    flush()
+    return merged, replaced
+
+def _partition_key(part):
+    return (part["day_of_week"], *part["cell"])
+
+def ingest_csv(csv_path, store_dir, cell_deg=0.05, chunksize=500_000, part_rows=1_000_000,
+               max_buffered_rows=2_000_000):
+    """
+    Converts a CSV history into a columnar store partitioned by day_of_week and
+    a `cell_deg` x `cell_deg` geocell. Each partition holds one .npy file per
+    column. Ingesting into an existing store appends new parts.
+
+    Rows are buffered per partition across CSV chunks and written in parts of
+    up to `part_rows` rows; when more than `max_buffered_rows` are buffered the
+    largest partitions are written early, and the small parts this leaves are
+    merged at the end. The manifest is written once, so readers see either
+    none or all of the ingested rows.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Data file not found: {csv_path}")
+    os.makedirs(store_dir, exist_ok=True)
+    if os.path.exists(os.path.join(store_dir, MANIFEST)):
+        manifest = _load_manifest(store_dir)
+        cell_deg = manifest["cell_deg"]
+    else:
+        manifest = {"cell_deg": cell_deg, "columns": None, "parts": [], "next_part": 0}
+
+    print(f"Ingesting {csv_path} into {store_dir}...")
+    buffers, buffered, total = {}, {}, 0
+    new_parts = []
+    def flush(key):
+        nonlocal total
+        new_parts.append(_write_part(store_dir, manifest, key, _concat_pieces(buffers.pop(key))))
+        total -= buffered.pop(key)
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        missing = [c for c in ("day_of_week", "lat", "lon") if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing partition columns in data: {missing}")
+        columns = list(chunk.columns)
+        if manifest["columns"] is None:
+            manifest["columns"] = columns
+        elif columns != manifest["columns"]:
+            raise ValueError(f"Columns {columns} do not match store columns {manifest['columns']}")
+
+        cell_lat, cell_lon = _geocell(chunk["lat"].to_numpy(), chunk["lon"].to_numpy(), cell_deg)
+        keys = pd.DataFrame({"day_of_week": chunk["day_of_week"].to_numpy(), "cell_lat": cell_lat, "cell_lon": cell_lon})
+        for key, idx in keys.groupby(["day_of_week", "cell_lat", "cell_lon"]).indices.items():
+            part = chunk.iloc[idx]
+            buffers.setdefault(key, []).append({col: _column_array(part[col]) for col in columns})
+            buffered[key] = buffered.get(key, 0) + len(idx)
+            total += len(idx)
+            if buffered[key] >= part_rows:
+                flush(key)
+        # Bound memory: write out the biggest buffers until half the budget is free
+        if total > max_buffered_rows:
+            for key in sorted(buffered, key=buffered.get, reverse=True):
+                if total <= max_buffered_rows // 2:
+                    break
+                flush(key)
+
+    for key in list(buffers):
+        flush(key)
+
+    # Early flushes can leave several small parts per partition; merge them
+    by_partition = {}
+    for part in new_parts:
+        by_partition.setdefault(_partition_key(part), []).append(part)
+    for parts in by_partition.values():
+        merged, replaced = _merge_parts(store_dir, manifest, parts, part_rows)
+        manifest["parts"].extend(merged)
+        for part in replaced:
+            shutil.rmtree(os.path.join(store_dir, part["path"]), ignore_errors=True)
+
+    # Readers only ever see complete parts
+    _write_manifest(store_dir, manifest)
+    print(f"Stored {sum(p['rows'] for p in manifest['parts'])} rows in {len(manifest['parts'])} parts.")
+    return store_dir
+
+def compact_store(store_dir, part_rows=1_000_000):
+    """
+    Merges the small parts left by repeated ingests so each partition has
+    as few parts of up to `part_rows` rows as possible. Replaced parts are
+    deleted after the new manifest is in place, so run it while no other
+    process is reading the store.
+    """
+    manifest = _load_manifest(store_dir)
+    by_partition = {}
+    for part in manifest["parts"]:
+        by_partition.setdefault(_partition_key(part), []).append(part)
+    parts, replaced = [], []
+    for group in by_partition.values():
+        merged, old = _merge_parts(store_dir, manifest, group, part_rows)
+        parts.extend(merged)
+        replaced.extend(old)
+    n_before = len(manifest["parts"])
+    manifest["parts"] = parts
+    _write_manifest(store_dir, manifest)
+    for part in replaced:
+        shutil.rmtree(os.path.join(store_dir, part["path"]), ignore_errors=True)
+    print(f"Compacted {n_before} parts into {len(parts)}.")
+    return store_dir
+
+def _bbox_for(near, radius_km):
+    # Same box as the API queries use, in this module's (lat, lon) order
+    min_lon, min_lat, max_lon, max_lat = bbox_for_radius(near[0], near[1], radius_km * 1000.0)
+    return min_lat, min_lon, max_lat, max_lon
+
+def _row_mask(get, n_rows, days, hours, bbox, near, radius_km):
+    mask = np.ones(n_rows, dtype=bool)
+    if days is not None:
+        mask &= np.isin(get("day_of_week"), list(days))
+    if hours is not None:
+        mask &= np.isin(get("hour"), list(hours))
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        lat, lon = get("lat"), get("lon")
+        mask &= (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    if near is not None:
+        mask &= haversine_m(near[0], near[1], get("lat"), get("lon")) <= radius_km * 1000.0
+    return mask
+
+def _filter_columns(days, hours, bbox, near):
+    cols = []
+    if days is not None: cols.append("day_of_week")
+    if hours is not None: cols.append("hour")
+    if bbox is not None or near is not None: cols += ["lat", "lon"]
+    return cols
+
+def iter_store(store_dir, columns=None, days=None, hours=None, bbox=None, near=None, radius_km=5.0):
+    """
+    Yields one DataFrame per matching partition.
+    Partitions are pruned by day and geocell before any file is opened, and
+    only the requested and filter columns are read (memory-mapped).
+    `bbox` is (min_lat, min_lon, max_lat, max_lon); `near` is (lat, lon)
+    and keeps rows within `radius_km` great-circle distance.
+    """
+    manifest = _load_manifest(store_dir)
+    cell_deg = manifest["cell_deg"]
+    columns = list(columns) if columns is not None else manifest["columns"]
+    missing = [c for c in columns if c not in manifest["columns"]]
+    if missing:
+        raise ValueError(f"Missing features in data: {missing}")
+
+    # Cell range that can contain matching rows
+    box = bbox
+    if near is not None:
+        near_box = _bbox_for(near, radius_km)
+        box = near_box if box is None else (max(box[0], near_box[0]), max(box[1], near_box[1]),
+                                            min(box[2], near_box[2]), min(box[3], near_box[3]))
+    if box is not None:
+        lo_lat, lo_lon = _geocell(np.array(box[0]), np.array(box[1]), cell_deg)
+        hi_lat, hi_lon = _geocell(np.array(box[2]), np.array(box[3]), cell_deg)
+
+    for part in manifest["parts"]:
+        if days is not None and part["day_of_week"] not in days:
+            continue
+        if box is not None:
+            clat, clon = part["cell"]
+            if not (lo_lat <= clat <= hi_lat and lo_lon <= clon <= hi_lon):
+                continue
+
+        # Columns are opened lazily, so only requested and filter columns are touched
+        part_dir = os.path.join(store_dir, part["path"])
+        arrays = {}
+        def get(col):
+            if col not in arrays:
+                arrays[col] = np.load(os.path.join(part_dir, f"{col}.npy"), mmap_mode="r")
+            return arrays[col]
+
+        mask = _row_mask(get, part["rows"], None, hours, bbox, near, radius_km)
+        if not mask.any():
+            continue
+        if mask.all():
+            yield pd.DataFrame({col: np.asarray(get(col)) for col in columns})
+        else:
+            yield pd.DataFrame({col: get(col)[mask] for col in columns})
+
+def query(store_dir, columns=None, **filters):
+    """
+    Reads the matching rows of a store into one DataFrame.
+    """
+    frames = list(iter_store(store_dir, columns=columns, **filters))
+    if not frames:
+        manifest = _load_manifest(store_dir)
+        return pd.DataFrame(columns=list(columns) if columns is not None else manifest["columns"])
+    return pd.concat(frames, ignore_index=True)
+
+def available_columns(source):
+    """
+    Column names in a CSV file or a store, without reading any rows.
+    """
+    if is_store(source):
+        return list(_load_manifest(source)["columns"] or [])
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Data file not found: {source}")
+    return list(pd.read_csv(source, nrows=0).columns)
+
+def read_traffic_data(source, columns=None, chunksize=None, days=None, hours=None, bbox=None, near=None, radius_km=5.0,
+                      compact=True):
+    """
+    Single entry point for traffic history: `source` may be a CSV file or a
+    store directory created by `ingest_csv`. Filters behave the same for both;
+    for a CSV they are applied while streaming, for a store they prune
+    partitions first. With `chunksize` an iterator of DataFrames is returned.
+    CSV columns are read with the compact FEATURE_DTYPES unless `compact` is
+    False, which keeps the values exactly as written (e.g. to pass them through).
+    """
+    filters = dict(days=days, hours=hours, bbox=bbox, near=near, radius_km=radius_km)
+    if is_store(source):
+        frames = iter_store(source, columns=columns, **filters)
+        return frames if chunksize is not None else query(source, columns=columns, **filters)
+
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Data file not found: {source}")
+    header = pd.read_csv(source, nrows=0).columns
+    columns = list(columns) if columns is not None else list(header)
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError(f"Missing features in data: {missing}")
+    needed = list(dict.fromkeys(columns + _filter_columns(days, hours, bbox, near)))
+    dtypes = {c: FEATURE_DTYPES[c] for c in needed if c in FEATURE_DTYPES} if compact else {}
+    if TARGET in needed and compact:
+        dtypes[TARGET] = TARGET_DTYPE
+
+    def frames(reader):
+        for chunk in reader:
+            mask = _row_mask(lambda c: chunk[c].to_numpy(), len(chunk), days, hours, bbox, near, radius_km)
+            yield chunk.loc[mask, columns].reset_index(drop=True)
+
+    if chunksize is not None:
+        return frames(pd.read_csv(source, usecols=needed, dtype=dtypes, chunksize=chunksize))
+    df = pd.read_csv(source, usecols=needed, dtype=dtypes)
+    if needed == columns and all(f is None for f in (days, hours, bbox, near)):
+        return df[columns]
+    return next(frames([df]))
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) == 3 and sys.argv[1] == "compact":
+        compact_store(sys.argv[2])
+        sys.exit(0)
+    if len(sys.argv) < 3:
+        print("Usage: python traffic_store.py <input.csv> <store_dir> [cell_deg]")
+        print("       python traffic_store.py compact <store_dir>")
+        sys.exit(1)
+    ingest_csv(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 0.05)
@@ -1,54 +1,104 @@
-import requests
+import math
+import time
 
-def fetch_current_weather(lat, lon):
+from cache_utils import TTLCache, get_session
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+# Open-Meteo accepts comma-separated coordinate lists; keep URLs a sensible length
+MAX_LOCATIONS_PER_REQUEST = 100
+
+# Parsed weather keyed by (geocell, hour)
+weather_cache = TTLCache(ttl=900.0, max_size=50000)
+
+def _parse_weather(data):
+    current = data.get("current", {})
+    hourly = data.get("hourly", {})
+
+    # Map WMO weather codes to our simple 1-4 scale
+    # 1=Clear, 2=Cloudy, 3=Rain, 4=Snow
+    wmo_code = current.get("weather_code", 0)
+    weather_condition = 1 # Default Clear
+
+    if wmo_code in [0, 1]: weather_condition = 1 # Clear
+    elif wmo_code in [2, 3, 45, 48]: weather_condition = 2 # Cloudy
+    elif wmo_code in [51, 53, 55, 61, 63, 65, 80, 81, 82]: weather_condition = 3 # Rain
+    elif wmo_code in [71, 73, 75, 77, 85, 86]: weather_condition = 4 # Snow
+
+    # Visibility is hourly; use the current hour when the times line up
+    vis_km = 10 # Default
+    if "visibility" in hourly and hourly["visibility"]:
+        times = hourly.get("time", [])
+        hour = current.get("time", "")[:13] + ":00"
+        idx = times.index(hour) if hour in times else 0
+        if hourly["visibility"][idx] is not None:
+            vis_km = hourly["visibility"][idx] / 1000.0
+
+    return {
+        "temperature": current.get("temperature_2m", 20),
+        "wind_speed": current.get("wind_speed_10m", 10),
+        "precipitation": current.get("precipitation", 0.0),
+        "weather_condition": weather_condition,
+        "visibility": vis_km,
+        "wmo_code": wmo_code
+    }
+
+def fetch_weather_batch(points, cell_deg=0.05, base_url=OPEN_METEO_URL, session=None, cache=weather_cache,
+                        batch_size=MAX_LOCATIONS_PER_REQUEST, timeout=10):
+    """
+    Current weather for many (lat, lon) points, returned in input order
+    (None where the fetch failed).
+
+    Points are snapped to `cell_deg` geocells, and each cell is looked up in
+    `cache` for the current hour. Only cells missing from the cache are
+    fetched, up to `batch_size` per Open-Meteo request, over one pooled
+    session.
+    """
+    hour = int(time.time() // 3600)
+    keys = [(math.floor(lat / cell_deg), math.floor(lon / cell_deg), hour) for lat, lon in points]
+    results = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        value = cache.get(key) if cache is not None else None
+        if value is None:
+            missing.append(key)
+        else:
+            results[key] = value
+
+    session = session or get_session()
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        # Each cell is fetched at its centre
+        params = {
+            "latitude": ",".join(f"{(i + 0.5) * cell_deg:.4f}" for i, _, _ in batch),
+            "longitude": ",".join(f"{(j + 0.5) * cell_deg:.4f}" for _, j, _ in batch),
+            "current": "temperature_2m,precipitation,rain,showers,snowfall,weather_code,wind_speed_10m",
+            "hourly": "visibility",
+            "forecast_days": 1
+        }
+        try:
+            response = session.get(base_url, params=params, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            # A single location comes back as one object, several as a list
+            locations = data if isinstance(data, list) else [data]
+            if len(locations) != len(batch):
+                raise ValueError(f"expected {len(batch)} locations, got {len(locations)}")
+            for key, location in zip(batch, locations):
+                results[key] = _parse_weather(location)
+                if cache is not None:
+                    cache.put(key, results[key])
+        except Exception as e:
+            print(f"Open-Meteo API Error: {e}")
+
+    return [results.get(key) for key in keys]
+
+def fetch_current_weather(lat, lon, base_url=OPEN_METEO_URL):
     """
     Fetches current weather data from Open-Meteo API.
     Returns a dictionary with temperature, wind, precip, visibility, etc.
+    Results are cached per geocell and hour (see fetch_weather_batch).
     """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "temperature_2m,precipitation,rain,showers,snowfall,weather_code,wind_speed_10m",
-        "hourly": "visibility",
-        "forecast_days": 1
-    }
-    
-    try:
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        current = data.get("current", {})
-        hourly = data.get("hourly", {})
-        
-        # Map WMO weather codes to our simple 1-4 scale
-        # 1=Clear, 2=Cloudy, 3=Rain, 4=Snow
-        wmo_code = current.get("weather_code", 0)
-        weather_condition = 1 # Default Clear
-        
-        if wmo_code in [0, 1]: weather_condition = 1 # Clear
-        elif wmo_code in [2, 3, 45, 48]: weather_condition = 2 # Cloudy
-        elif wmo_code in [51, 53, 55, 61, 63, 65, 80, 81, 82]: weather_condition = 3 # Rain
-        elif wmo_code in [71, 73, 75, 77, 85, 86]: weather_condition = 4 # Snow
-        
-        # Visibility is hourly, take the first one (current hour approx)
-        vis_km = 10 # Default
-        if "visibility" in hourly and hourly["visibility"]:
-            vis_km = hourly["visibility"][0] / 1000.0
-            
-        return {
-            "temperature": current.get("temperature_2m", 20),
-            "wind_speed": current.get("wind_speed_10m", 10),
-            "precipitation": current.get("precipitation", 0.0),
-            "weather_condition": weather_condition,
-            "visibility": vis_km,
-            "wmo_code": wmo_code
-        }
-        
-    except Exception as e:
-        print(f"Open-Meteo API Error: {e}")
-        return None
+    return fetch_weather_batch([(lat, lon)], base_url=base_url)[0]
 
 if __name__ == "__main__":
     # Test for NYC